@@ -1,55 +1,102 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, current_app
 from datetime import datetime
-from models import db, User, Message, Resource, Task, TaskAssignee, Channel, ChannelMember, Poll, PollOption, PollVote, MessageReaction, SheetCell, Notification, TaskAuditLog, Achievement
-from helpers import login_required, get_current_user, role_required
-import re
+from models import db, User, Message, Resource, Task, TaskAssignee, Channel, ChannelMember, Poll, PollOption, PollVote, SheetCell, Notification, TaskAuditLog, Achievement, ModerationJob, BroadcastNotification
+from helpers import login_required, get_current_user, role_required, current_user_record, user_record_changed
+from services import MessageService, ChangeFeed, ReactionService, UnreadService, ChannelListService, NotificationService, MembershipService
+import realtime
+import search as search_index
+import archive
+import fanout
+import moderation
+import wire
+from presence import get_tracker as presence
+from mentions import get_index as mention_index
+import json
+import time
+import hashlib
 
 api = Blueprint('api', __name__)
 
+def channel_list(user):
+    """Serialized list of channels visible to a user (shared by /channels and /sync); cached, see ChannelListService."""
+    # Beats this worker has seen but not yet flushed count as online too
+    tracker = presence()
+    return [dict(c, other_user_online=True) if c['other_user_id'] and not c['other_user_online'] and tracker.is_online(c['other_user_id']) else c
+            for c in ChannelListService.get(user)]
+
+
+def notification_list(user):
+    """Serialized unread notifications for a user (targeted and broadcast), newest first."""
+    return [{
+        'id': notif_id, 'kind': kind, 'message_id': message_id, 'channel_id': channel_id,
+        'author_name': author_name, 'content': content,
+        'created_at': created_at.strftime('%I:%M %p')
+    } for kind, notif_id, message_id, created_at, channel_id, content, author_name in NotificationService.unread(user)]
+
+
+def notification_watermark(user):
+    """Cheap fingerprint of the unread set: changes whenever one is added or read."""
+    return NotificationService.watermark(user)
+
+
 @api.route('/channels')
 @login_required
 def get_channels():
     """Get list of channels visible to current user."""
-    user = get_current_user()
-    
-    # Logic:
-    # 1. Groups: Show ALL that are NOT private.
-    # 2. Groups (Private): Show only if member.
-    # 3. DMs: Show only if member.
-    
-    # User is member of:
-    my_channel_ids = [cm.channel_id for cm in ChannelMember.query.filter_by(user_id=user.id).all()]
-    
-    # Query: (is_private=False AND channel_type='group') OR (id IN my_channel_ids)
-    channels = Channel.query.filter(
-        db.or_(
-            db.and_(Channel.is_private == False, Channel.channel_type == 'group'),
-            Channel.id.in_(my_channel_ids)
-        )
-    ).distinct().order_by(Channel.created_at).all()
-        
-    return jsonify([{
-        'id': c.id,
-        'name': c.name,
-        'channel_type': c.channel_type,
-        'is_private': c.is_private,
-        'is_member': c.id in my_channel_ids,
-        'other_user_name': User.query.get(ChannelMember.query.filter(ChannelMember.channel_id==c.id, ChannelMember.user_id!=user.id).first().user_id).name if c.channel_type == 'dm' and ChannelMember.query.filter(ChannelMember.channel_id==c.id, ChannelMember.user_id!=user.id).first() else None,
-        'other_user_avatar_color': User.query.get(ChannelMember.query.filter(ChannelMember.channel_id==c.id, ChannelMember.user_id!=user.id).first().user_id).avatar_color if c.channel_type == 'dm' and ChannelMember.query.filter(ChannelMember.channel_id==c.id, ChannelMember.user_id!=user.id).first() else None
-    } for c in channels])
+    return wire.respond(channel_list(current_user_record()))
 
 
-@api.route('/messages/<int:channel_id>')
+@api.route('/sync')
 @login_required
-def api_messages(channel_id):
-    user = get_current_user()
-    is_member = ChannelMember.query.filter_by(channel_id=channel_id, user_id=user.id).first()
-    if not is_member: return jsonify([]), 403
-
-    after_id = request.args.get('after', 0, type=int)
-    before_id = request.args.get('before', 0, type=int)
-    limit = request.args.get('limit', 100, type=int)
-    
+def api_sync():
+    """
+    One poll for everything a tab watches. The client echoes back the
+    watermarks from its last response; only sections whose watermark moved
+    are returned, and 304 when If-None-Match already names the current tag.
+      channels=<tag>        channel list (omit the param to skip the section)
+      notifications=<tag>   unread notifications
+      channel_id=<id>&since=<seq>   change feed of the open channel
+    """
+    user = current_user_record()
+    result = {'watermark': {}}
+
+    if 'channels' in request.args:
+        channels = channel_list(user)
+        tag = hashlib.sha1(json.dumps(channels, sort_keys=True).encode()).hexdigest()[:16]
+        result['watermark']['channels'] = tag
+        if tag != request.args.get('channels'):
+            result['channels'] = channels
+
+    if 'notifications' in request.args:
+        tag = notification_watermark(user)
+        result['watermark']['notifications'] = tag
+        if tag != request.args.get('notifications'):
+            result['notifications'] = notification_list(user)
+
+    channel_id = request.args.get('channel_id', type=int)
+    since = request.args.get('since', type=int)
+    if channel_id and since is not None:
+        if not MembershipService.is_member(user.id, channel_id):
+            return jsonify({'error': 'Not a member'}), 403
+        seq = ChangeFeed.latest_seq(channel_id)
+        result['watermark']['since'] = max(seq, since)
+        if seq > since:
+            result['changes'] = ChangeFeed.changes_since(channel_id, since, user)
+            result['watermark']['since'] = result['changes']['seq']
+
+    etag = hashlib.sha1(json.dumps(result['watermark'], sort_keys=True).encode()).hexdigest()[:16]
+    # Revalidate only against a tag the client actually holds; the body is
+    # per-watermark, so never let the browser answer from its own cache.
+    if request.if_none_match.contains_weak(etag):  # weak: compression weakens the tag
+        return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'})
+    response = jsonify(result)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def message_page(channel_id, user, before_id=0, after_id=0, limit=100):
+    """One page of a channel's chat, oldest first, continuing into the archive once live history runs out."""
     query = Message.query.filter_by(channel_id=channel_id)
     
     if before_id:
@@ -65,57 +112,48 @@ def api_messages(channel_id):
         query = query.order_by(Message.id.desc()).limit(limit)
         messages = list(reversed(query.all()))
 
-    result = []
-    for msg in messages:
-        reactions_raw = MessageReaction.query.filter_by(message_id=msg.id).all()
-        reactions_map = {}
-        for r in reactions_raw:
-            if r.emoji not in reactions_map: reactions_map[r.emoji] = {'count': 0, 'users': [], 'user_reacted': False}
-            reactions_map[r.emoji]['count'] += 1
-            reactions_map[r.emoji]['users'].append(r.user_id)
-            if r.user_id == user.id: reactions_map[r.emoji]['user_reacted'] = True
-
-        poll_data = None
-        poll = Poll.query.filter_by(message_id=msg.id).first()
-        if poll:
-            total_votes = sum(len(opt.votes) for opt in poll.options)
-            poll_data = {
-                'id': poll.id,
-                'question': poll.question,
-                'is_active': poll.is_active,
-                'options': [{
-                    'id': opt.id,
-                    'text': opt.text,
-                    'votes': len(opt.votes),
-                    'pct': round(len(opt.votes) / total_votes * 100) if total_votes else 0,
-                    'user_voted': any(v.user_id == user.id for v in opt.votes),
-                    'voters': [{'id': v.user.id, 'name': v.user.name} for v in opt.votes]
-                } for opt in poll.options],
-                'total_votes': total_votes
-            }
-
-        result.append({
-            'id': msg.id,
-            'user_id': msg.user_id,
-            'content': msg.content,
-            'message_type': msg.message_type,
-            'author_name': msg.author.name,
-            'author_role': msg.author.role,
-            'author_avatar_color': msg.author.avatar_color,
-            'created_at': msg.created_at.strftime('%I:%M %p'),
-            'is_own': msg.user_id == user.id,
-            'referenced_task': {'title': msg.referenced_task.title, 'status': msg.referenced_task.status, 'due_date': msg.referenced_task.due_date.strftime('%b %d') if msg.referenced_task.due_date else None} if msg.referenced_task else None,
-            'reactions': reactions_map,
-            'poll': poll_data
-        })
-    return jsonify(result)
+    page = MessageService.serialize_page(messages, user)
+    if not after_id and len(messages) < limit:
+        # Ran out of live history: continue into the archive
+        older_than = messages[0].id if messages else before_id or None
+        page = archive.load_page(channel_id, older_than, limit - len(messages), user) + page
+    return page
+
+
+@api.route('/messages/<int:channel_id>')
+@login_required
+def api_messages(channel_id):
+    user = current_user_record()
+    if not MembershipService.is_member(user.id, channel_id): return jsonify([]), 403
+
+    return wire.respond(message_page(
+        channel_id, user,
+        before_id=request.args.get('before', 0, type=int),
+        after_id=request.args.get('after', 0, type=int),
+        limit=request.args.get('limit', 100, type=int),
+    ))
+
+
+@api.route('/channels/<int:channel_id>/changes')
+@login_required
+def api_channel_changes(channel_id):
+    """Incremental sync: created/deleted messages, reaction toggles and poll votes after `since`."""
+    user = current_user_record()
+    if not MembershipService.is_member(user.id, channel_id):
+        return jsonify({'error': 'Not a member'}), 403
+
+    since = request.args.get('since', type=int)
+    if since is None:
+        # Bootstrap: hand out the current position, the client loads the page itself
+        return jsonify({'seq': ChangeFeed.latest_seq(channel_id), 'reset': False, 'has_more': False, 'changes': [], 'messages': []})
+    return jsonify(ChangeFeed.changes_since(channel_id, since, user))
 
 
 @api.route('/messages/<int:channel_id>/send', methods=['POST'])
 @login_required
 def api_send_message(channel_id):
     user = get_current_user()
-    if not ChannelMember.query.filter_by(channel_id=channel_id, user_id=user.id).first():
+    if not MembershipService.is_member(user.id, channel_id):
         return jsonify({'error': 'Not a member'}), 403
 
     data = request.get_json() or {}
@@ -129,73 +167,14 @@ def api_send_message(channel_id):
         referenced_task_id=data.get('referenced_task_id')
     )
     db.session.add(msg)
+    db.session.flush()
+    MessageService.record_created(msg)
+    # @mention / DM notifications are fanned out in the background
+    job = fanout.enqueue(msg)
     db.session.commit()
-    
-    # Mentions (for group channels)
-    mentioned_tokens = set(re.findall(r"@([a-zA-Z0-9_ -]+)", content))
-    notify_user_ids = set()
-    
-    if mentioned_tokens:
-        # 1. Handle Role Mentions
-        roles_map = {
-            'jsec': 'jsec',
-            'coordinator': 'coordinator', 
-            'member': 'member'
-        }
-        
-        # Helper to find users by role
-        def get_users_by_role(r_name):
-            if r_name == 'all':
-                # Notify all members of this channel
-                 members = ChannelMember.query.filter_by(channel_id=channel_id).all()
-                 return [m.user_id for m in members]
-            return [u.id for u in User.query.filter_by(role=roles_map[r_name]).all()]
-
-        for token in mentioned_tokens:
-            token_clean = token.strip()
-            token_lower = token_clean.lower()
-            
-            # Check if it STARTS with a role (to handle greedy regex matching like "all hello")
-            found_role = None
-            if token_lower == 'all' or token_lower.startswith('all '):
-                found_role = 'all'
-            else:
-                for r in roles_map:
-                    if token_lower == r or token_lower.startswith(r + ' '):
-                        found_role = r
-                        break
-            
-            if found_role:
-                notify_user_ids.update(get_users_by_role(found_role))
-                # Note: We assume if it matched a role, it's not a username mention (or priority given to role)
-            else:
-                # 2. Handle Name Mentions
-                # Exact match check
-                u = User.query.filter(User.name == token_clean).first()
-                if u: 
-                    notify_user_ids.update([u.id])
-        
-        # 3. Create Notifications
-        if user.id in notify_user_ids: notify_user_ids.remove(user.id)
-        
-        for uid in notify_user_ids:
-            # Check for existing to avoid duplicates if multiple mentions target same user
-             if not Notification.query.filter_by(user_id=uid, message_id=msg.id).first():
-                db.session.add(Notification(user_id=uid, message_id=msg.id))
-        
-        db.session.commit()
 
-    # DM auto-notification: notify other user without needing @mention
-    channel = Channel.query.get(channel_id)
-    if channel and channel.channel_type == 'dm':
-        dm_members = ChannelMember.query.filter_by(channel_id=channel_id).all()
-        for m in dm_members:
-            if m.user_id != user.id:
-                # Only create if not already notified via @mention above or role
-                existing = Notification.query.filter_by(user_id=m.user_id, message_id=msg.id).first()
-                if not existing:
-                    db.session.add(Notification(user_id=m.user_id, message_id=msg.id))
-        db.session.commit()
+    fanout.submit(job)
+    realtime.publish_message(msg)
 
     return jsonify({'id': msg.id, 'content': msg.content, 'created_at': msg.created_at.strftime('%I:%M %p')})
 
@@ -206,15 +185,11 @@ def api_react(msg_id):
     user = get_current_user()
     emoji = (request.get_json() or {}).get('emoji')
     if not emoji: return jsonify({'error': 'No emoji'}), 400
+    msg = Message.query.get_or_404(msg_id)
 
-    existing = MessageReaction.query.filter_by(message_id=msg_id, user_id=user.id, emoji=emoji).first()
-    if existing:
-        db.session.delete(existing)
-        action = 'removed'
-    else:
-        db.session.add(MessageReaction(message_id=msg_id, user_id=user.id, emoji=emoji))
-        action = 'added'
+    action, count = ReactionService.toggle(msg, user.id, emoji)
     db.session.commit()
+    realtime.publish_reaction(msg.channel_id, msg_id, emoji, user.id, action, count)
     return jsonify({'action': action})
 
 
@@ -225,16 +200,10 @@ def api_delete_message(msg_id):
     user = get_current_user()
     if msg.user_id != user.id and user.role != 'jsec': return jsonify({'error': 'Permission denied'}), 403
     
-    # Clean up Polls
-    poll = Poll.query.filter_by(message_id=msg.id).first()
-    if poll:
-        for opt in poll.options: PollVote.query.filter_by(option_id=opt.id).delete()
-        PollOption.query.filter_by(poll_id=poll.id).delete()
-        db.session.delete(poll)
-    
-    MessageReaction.query.filter_by(message_id=msg.id).delete()
-    db.session.delete(msg)
+    channel_id = msg.channel_id
+    MessageService.delete_messages([msg.id])
     db.session.commit()
+    realtime.publish_deletion(channel_id, msg_id)
     return jsonify({'deleted': True})
 
 
@@ -247,7 +216,7 @@ def api_create_poll():
     question = data.get('question')
     options = data.get('options', [])
     
-    if not ChannelMember.query.filter_by(channel_id=channel_id, user_id=user.id).first():
+    if not MembershipService.is_member(user.id, channel_id):
         return jsonify({'error': 'Not a member'}), 403
         
     msg = Message(user_id=user.id, content=f'📊 Poll: {question}', channel_id=channel_id, message_type='poll')
@@ -261,7 +230,9 @@ def api_create_poll():
     for i, txt in enumerate(options):
         db.session.add(PollOption(poll_id=poll.id, text=txt.strip(), sort_order=i))
         
+    MessageService.record_created(msg)
     db.session.commit()
+    realtime.publish_message(msg)
     return jsonify({'poll_id': poll.id})
 
 
@@ -280,15 +251,164 @@ def api_vote_poll(poll_id):
         if existing: db.session.delete(existing)
         
     db.session.add(PollVote(option_id=opt_id, user_id=user.id))
+    if poll.message_id:
+        ChangeFeed.record(poll.channel_id, 'poll_vote', poll.message_id)
+        MessageService.touch(poll.message_id)
     db.session.commit()
+    if poll.message_id: realtime.publish_poll(poll.channel_id, poll.message_id)
     return jsonify({'voted': True})
 
 
+@api.route('/search')
+@login_required
+def api_search():
+    """Full-text search over messages in the caller's channels: ?q=&channel_id=&limit=&offset="""
+    if not search_index.enabled():
+        return jsonify({'error': 'Search unavailable'}), 503
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'Empty query'}), 400
+    limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    results = search_index.search(get_current_user(), q[:200], channel_id=request.args.get('channel_id', type=int),
+                                  limit=limit, offset=offset)
+    return jsonify({'results': results, 'has_more': len(results) == limit})
+
+
+# ─── Moderation ───
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None) if value else None
+
+
+@api.route('/moderation/purge', methods=['POST'])
+@login_required
+def api_moderation_purge():
+    """
+    Queue a bulk delete of messages matching channel_id / author_id / since / until
+    (ISO timestamps, UTC). Runs in the background; poll /moderation/jobs/<id> for progress.
+    """
+    user = get_current_user()
+    if user.role != 'jsec': return jsonify({'error': 'Permission denied'}), 403
+    data = request.get_json() or {}
+    try:
+        channel_id = int(data['channel_id']) if data.get('channel_id') else None
+        author_id = int(data['author_id']) if data.get('author_id') else None
+        since, until = _parse_time(data.get('since')), _parse_time(data.get('until'))
+        batch_size = max(1, min(int(data.get('batch_size') or current_app.config.get('MODERATION_BATCH_SIZE', 500)), 5000))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid filter'}), 400
+    if not (channel_id or author_id or since or until):
+        return jsonify({'error': 'At least one filter is required'}), 400
+    if channel_id and not db.session.get(Channel, channel_id):
+        return jsonify({'error': 'Channel not found'}), 404
+
+    job = moderation.queue_purge(user.id, channel_id=channel_id, author_id=author_id, since=since, until=until, batch_size=batch_size)
+    return jsonify(moderation.describe(job)), 202
+
+
+@api.route('/moderation/jobs')
+@login_required
+def api_moderation_jobs():
+    if get_current_user().role != 'jsec': return jsonify({'error': 'Permission denied'}), 403
+    jobs = ModerationJob.query.order_by(ModerationJob.id.desc()).limit(50).all()
+    return jsonify([moderation.describe(j) for j in jobs])
+
+
+@api.route('/moderation/jobs/<int:job_id>')
+@login_required
+def api_moderation_job(job_id):
+    if get_current_user().role != 'jsec': return jsonify({'error': 'Permission denied'}), 403
+    return jsonify(moderation.describe(ModerationJob.query.get_or_404(job_id)))
+
+
+@api.route('/moderation/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def api_moderation_cancel(job_id):
+    if get_current_user().role != 'jsec': return jsonify({'error': 'Permission denied'}), 403
+    job = ModerationJob.query.get_or_404(job_id)
+    if not moderation.cancel(job):
+        return jsonify({'error': f'Job already {job.status}'}), 409
+    return jsonify(moderation.describe(job))
+
+
+@api.route('/stream')
+@login_required
+def api_stream():
+    """Server-Sent Events: pushes message, reaction, deletion, poll, notification and presence events."""
+    slots = realtime.stream_slots()
+    if not slots.acquire(blocking=False):
+        # Every stream thread of this worker is taken; the tab keeps polling /api/sync and retries later
+        return jsonify({'error': 'Live updates are at capacity'}), 503, {'Retry-After': '60'}
+    try:
+        user = current_user_record()
+        channel_ids = [cm.channel_id for cm in ChannelMember.query.filter_by(user_id=user.id).all()]
+        topics = [realtime.user_topic(user.id), realtime.BROADCAST_TOPIC] + [realtime.channel_topic(cid) for cid in channel_ids]
+        user_id = user.id
+
+        keepalive = current_app.config.get('STREAM_KEEPALIVE', 15)
+        max_age = current_app.config.get('STREAM_MAX_AGE', 300)
+        sub = realtime.get_broker().subscribe(topics)
+    except Exception:
+        slots.release()
+        raise
+    tracker = presence()
+    db.session.remove()  # don't hold a pooled connection for the life of the stream
+
+    def generate():
+        # Streams are recycled after max_age so reconnects pick up membership changes
+        deadline = time.monotonic() + max_age
+        try:
+            yield 'retry: 3000\n\n'
+            while time.monotonic() < deadline:
+                event = sub.get(timeout=keepalive)
+                tracker.beat(user_id)  # an open stream counts as being online
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                if event.get('exclude_user_id') == user_id:
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        except ConnectionError:
+            pass
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    # Run on close even if the client went away before the first chunk was sent
+    response.call_on_close(sub.close)
+    response.call_on_close(slots.release)
+    return response
+
+
 @api.route('/members')
 @login_required
 def api_members():
     members = User.query.order_by(User.name).all()
-    return jsonify([{'id': m.id, 'name': m.name, 'unique_id': m.unique_id, 'role': m.role, 'avatar_color': m.avatar_color} for m in members])
+    return wire.respond([{'id': m.id, 'name': m.name, 'unique_id': m.unique_id, 'role': m.role, 'avatar_color': m.avatar_color} for m in members])
+
+
+@api.route('/channels/<int:channel_id>/members')
+@login_required
+def api_channel_members(channel_id):
+    """Members of a channel, for the group settings panel (loaded when it opens)."""
+    user = get_current_user()
+    if not MembershipService.is_member(user.id, channel_id):
+        return jsonify({'error': 'Not a member'}), 403
+    members = db.session.query(User.id, User.name, User.role, User.avatar_color).join(
+        ChannelMember, ChannelMember.user_id == User.id
+    ).filter(ChannelMember.channel_id == channel_id).order_by(User.name).all()
+    return wire.respond([{'id': uid, 'name': name, 'role': role, 'avatar_color': color} for uid, name, role, color in members])
+
+
+@api.route('/mentions/suggest')
+@login_required
+def mention_suggest():
+    """@mention typeahead served from the in-memory index. roles=0 leaves out @all/@jsec/..."""
+    q = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    roles = request.args.get('roles', '1') != '0'
+    return jsonify(mention_index().suggest(q, limit, roles=roles))
 
 
 @api.route('/resources')
@@ -337,13 +457,7 @@ def api_bulk_update_sheet(sheet_id):
 @api.route('/notifications')
 @login_required
 def get_notifications():
-    user = get_current_user()
-    notifs = Notification.query.filter_by(user_id=user.id, is_read=False).order_by(Notification.created_at.desc()).all()
-    return jsonify([{
-        'id': n.id, 'message_id': n.message_id, 'channel_id': n.message.channel_id,
-        'author_name': n.message.author.name, 'content': n.message.content,
-        'created_at': n.created_at.strftime('%I:%M %p')
-    } for n in notifs])
+    return jsonify(notification_list(current_user_record()))
 
 
 @api.route('/notifications/<int:notif_id>/read', methods=['POST'])
@@ -356,31 +470,60 @@ def mark_notification_read(notif_id):
     return jsonify({'success': True})
 
 
+@api.route('/notifications/broadcast/<int:broadcast_id>/read', methods=['POST'])
+@login_required
+def mark_broadcast_read(broadcast_id):
+    BroadcastNotification.query.get_or_404(broadcast_id)
+    NotificationService.dismiss(get_current_user().id, broadcast_id)
+    db.session.commit()
+    return jsonify({'success': True})
+
+
+@api.route('/channels/<int:channel_id>/read', methods=['POST'])
+@login_required
+def mark_channel_read(channel_id):
+    """Advance the caller's read cursor; body {message_id} or empty for "everything so far"."""
+    user = current_user_record()
+    cm = ChannelMember.query.filter_by(channel_id=channel_id, user_id=user.id).first()
+    if not cm: return jsonify({'error': 'Not a member'}), 403
+    before = cm.unread_count
+    unread = UnreadService.mark_read(cm, (request.get_json(silent=True) or {}).get('message_id'))
+    db.session.commit()
+    if unread != before:
+        realtime.publish_channels_changed([user.id])  # other tabs refresh their badges
+    return jsonify({'last_read_message_id': cm.last_read_message_id, 'unread_count': unread})
+
 @api.route('/channels/<int:channel_id>/mute', methods=['POST'])
 @login_required
 def toggle_mute(channel_id):
-    cm = ChannelMember.query.filter_by(channel_id=channel_id, user_id=get_current_user().id).first()
+    # The row being toggled is the membership check
+    cm = ChannelMember.query.filter_by(channel_id=channel_id, user_id=current_user_record().id).first()
     if not cm: return jsonify({'error': 'Not a member'}), 403
     cm.is_muted = not cm.is_muted
     db.session.commit()
+    ChannelListService.invalidate([cm.user_id])
     return jsonify({'is_muted': cm.is_muted})
 
 @api.route('/channels/<int:channel_id>/pin', methods=['POST'])
 @login_required
 def toggle_pin(channel_id):
-    cm = ChannelMember.query.filter_by(channel_id=channel_id, user_id=get_current_user().id).first()
+    # The row being toggled is the membership check
+    cm = ChannelMember.query.filter_by(channel_id=channel_id, user_id=current_user_record().id).first()
     if not cm: return jsonify({'error': 'Not a member'}), 403
     cm.is_pinned = not cm.is_pinned
     db.session.commit()
+    ChannelListService.invalidate([cm.user_id])
     return jsonify({'is_pinned': cm.is_pinned})
 
 @api.route('/channels/<int:channel_id>/archive', methods=['POST'])
 @login_required
 def toggle_archive(channel_id):
-    cm = ChannelMember.query.filter_by(channel_id=channel_id, user_id=get_current_user().id).first()
+    # The row being toggled is the membership check
+    cm = ChannelMember.query.filter_by(channel_id=channel_id, user_id=current_user_record().id).first()
     if not cm: return jsonify({'error': 'Not a member'}), 403
     cm.is_archived = not cm.is_archived
     db.session.commit()
+    ChannelListService.invalidate([cm.user_id])
     return jsonify({'is_archived': cm.is_archived})
 
 
@@ -390,7 +533,7 @@ def toggle_archive(channel_id):
 def get_tasks_api():
     tasks = Task.query.order_by(Task.due_date.asc().nullslast(), Task.created_at.desc()).all()
     user = get_current_user()
-    return jsonify([{
+    return wire.respond([{
         'id': t.id,
         'title': t.title,
         'description': t.description,
@@ -715,5 +858,6 @@ def update_profile_api():
     if 'current_work' in data:
         user.current_work = data['current_work'][:255]
     
+    user_record_changed(user)
     db.session.commit()
     return jsonify({'success': True})
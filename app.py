@@ -1,11 +1,23 @@
 import os
 from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 from flask_migrate import Migrate
 from models import db, Channel
 from auth import auth, seed_default_user
 from views import views
 from api import api
+from realtime import init_broker
+from commands import register_commands
+from fanout import init_fanout
+from mentions import init_mentions
+from search import init_search
+from cache import init_cache
+from moderation import init_moderation
+from wire import init_wire
+from presence import init_presence
+from helpers import check_user_lookups
+from passwords import init_passwords
 
 
 load_dotenv()
@@ -30,21 +42,93 @@ def create_app():
         'pool_recycle': 300,
     }
 
+    # Live updates (SSE). Set STREAM_BROKER_URL=redis://... to share events across workers
+    app.config['STREAM_BROKER_URL'] = os.getenv('STREAM_BROKER_URL', '')
+    app.config['STREAM_KEEPALIVE'] = 15  # seconds between keepalive comments
+    app.config['STREAM_MAX_AGE'] = 300  # seconds before a stream is recycled
+    # Each open stream holds a worker thread for up to STREAM_MAX_AGE; keep this below gunicorn's --threads
+    # so page loads and API calls keep the rest. Tabs refused a slot get a 503 and stay on /api/sync polling
+    app.config['STREAM_MAX_CONNECTIONS'] = int(os.getenv('STREAM_MAX_CONNECTIONS', 4))
+    # Background threads for @mention/DM notification fan-out (0 = run inline)
+    app.config['NOTIFY_WORKERS'] = int(os.getenv('NOTIFY_WORKERS', 4))
+
+    # Messages older than this (rounded down to whole months) move to archive blocks on `flask archive-messages`
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.getenv('ARCHIVE_AFTER_DAYS', 180))
+
+    # Per-worker LRU of serialized messages (viewer-independent part); TTL bounds staleness of author/task fields
+    app.config['MESSAGE_CACHE_SIZE'] = int(os.getenv('MESSAGE_CACHE_SIZE', 5000))
+    app.config['MESSAGE_CACHE_TTL'] = int(os.getenv('MESSAGE_CACHE_TTL', 120))
+    # Per-worker cache of each user's channel list; writes invalidate it, the TTL bounds staleness across workers
+    app.config['CHANNEL_LIST_CACHE_SIZE'] = int(os.getenv('CHANNEL_LIST_CACHE_SIZE', 2000))
+    app.config['CHANNEL_LIST_CACHE_TTL'] = int(os.getenv('CHANNEL_LIST_CACHE_TTL', 60))
+    # Per-worker cache of signed-in users' id/name/role/avatar, so polls authenticate without a query;
+    # edits bump users.record_version, the TTL bounds how long another worker serves the old record
+    app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 5000))
+    app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', 60))
+    # Per-worker cache of which channels each user belongs to, for authorizing channel-scoped calls;
+    # the TTL bounds how long another worker's removal can go unnoticed
+    app.config['MEMBERSHIP_CACHE_SIZE'] = int(os.getenv('MEMBERSHIP_CACHE_SIZE', 5000))
+    app.config['MEMBERSHIP_CACHE_TTL'] = int(os.getenv('MEMBERSHIP_CACHE_TTL', 30))
+
+    # Bulk message purges (/api/moderation): messages deleted per transaction, background threads (0 = run inline)
+    app.config['MODERATION_BATCH_SIZE'] = int(os.getenv('MODERATION_BATCH_SIZE', 500))
+    app.config['MODERATION_WORKERS'] = int(os.getenv('MODERATION_WORKERS', 1))
+
+    # gzip / brotli (if installed) for JSON and MessagePack responses at least this many bytes
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    app.config['COMPRESS_GZIP_LEVEL'] = 6
+    app.config['COMPRESS_BR_QUALITY'] = 4
+
+    # Presence: users are online for PRESENCE_TTL seconds after their last request or stream keepalive;
+    # heartbeats are written to users.last_seen in one batch every PRESENCE_FLUSH_INTERVAL seconds (0 = every request)
+    app.config['PRESENCE_TTL'] = int(os.getenv('PRESENCE_TTL', 90))
+    app.config['PRESENCE_FLUSH_INTERVAL'] = int(os.getenv('PRESENCE_FLUSH_INTERVAL', 15))
+
+    # Password hashing: processes per worker (0 = inline) and how many hashes may run or wait before
+    # sign-ins get a 503; stored hashes made with another method/cost are re-hashed on the next sign-in
+    app.config['PASSWORD_WORKERS'] = int(os.getenv('PASSWORD_WORKERS', 1))
+    app.config['PASSWORD_QUEUE_LIMIT'] = int(os.getenv('PASSWORD_QUEUE_LIMIT', 16))
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')  # full werkzeug form, as stored
+    # Failed sign-ins allowed per account / per client IP before it's refused for LOGIN_THROTTLE_WINDOW seconds
+    app.config['LOGIN_MAX_FAILURES_PER_ACCOUNT'] = int(os.getenv('LOGIN_MAX_FAILURES_PER_ACCOUNT', 5))
+    app.config['LOGIN_MAX_FAILURES_PER_IP'] = int(os.getenv('LOGIN_MAX_FAILURES_PER_IP', 20))
+    app.config['LOGIN_THROTTLE_WINDOW'] = int(os.getenv('LOGIN_THROTTLE_WINDOW', 300))
+    # Reverse proxies in front of the app (Render: 1), so request.remote_addr is the client's address
+    proxy_hops = int(os.getenv('TRUSTED_PROXY_HOPS', 0))
+    if proxy_hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops, x_proto=proxy_hops)
+
+    # Fail any request that loads the signed-in user more than once (tests, debugging)
+    app.config['USER_LOOKUP_CHECK'] = os.getenv('USER_LOOKUP_CHECK', '0') == '1'
+
     # Initialize extensions
     db.init_app(app)
     migrate = Migrate(app, db)
+    init_broker(app)
+    init_cache(app)
+    init_wire(app)
+    init_presence(app)
+    init_passwords(app)
+    check_user_lookups(app)  # no-op per request unless USER_LOOKUP_CHECK is on
 
 
     # Register blueprints
     app.register_blueprint(auth)
     app.register_blueprint(views)
     app.register_blueprint(api, url_prefix='/api')
+    register_commands(app)
 
     # Create tables & seed
     with app.app_context():
         db.create_all()
         print('✓ Database tables created')
         seed_default_user()
+    init_search(app)
+
+    # In-memory @mention index (built after seeding so the admin is in it)
+    init_mentions(app)
+    init_fanout(app)
+    init_moderation(app)
 
     # Register Error Handlers
     from flask import render_template
@@ -57,4 +141,6 @@ def create_app():
 app = create_app()
 
 if __name__ == '__main__':
+    # Spawned hashing processes would re-run this script as their __main__; the dev server hashes inline
+    app.extensions['passwords'].workers = 0
     app.run(debug=True, port=5000)
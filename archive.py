@@ -0,0 +1,175 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+from models import db, User, Task, Message, MessageReaction, Poll, MessageArchiveBlock
+from services import MessageService, UnreadService, after_commit
+from cache import message_cache
+
+
+# Ids per IN (...) clause when moving rows around
+CHUNK = 500
+
+
+def pack(records):
+    return zlib.compress(json.dumps(records, separators=(',', ':')).encode('utf-8'), 9)
+
+
+def unpack(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+def _month_start(dt):
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(dt):
+    return dt.replace(year=dt.year + dt.month // 12, month=dt.month % 12 + 1)
+
+
+def _chunks(ids):
+    for i in range(0, len(ids), CHUNK):
+        yield ids[i:i + CHUNK]
+
+
+def cutoff_for(days):
+    """Archive whole months only: everything before the month that was `days` ago."""
+    return _month_start(datetime.utcnow() - timedelta(days=days))
+
+
+# ─── Writing ───
+def _records_for(messages):
+    """Self-contained JSON records for a batch of messages, including reactions and polls."""
+    ids = [m.id for m in messages]
+    reactions, polls = {}, {}
+    for chunk in _chunks(ids):
+        for message_id, user_id, emoji in db.session.query(MessageReaction.message_id, MessageReaction.user_id, MessageReaction.emoji).filter(
+                MessageReaction.message_id.in_(chunk)).order_by(MessageReaction.created_at, MessageReaction.id):
+            reactions.setdefault(message_id, []).append([user_id, emoji])
+        for poll in Poll.query.filter(Poll.message_id.in_(chunk)).all():
+            polls[poll.message_id] = {
+                'id': poll.id, 'question': poll.question, 'is_active': poll.is_active, 'created_by': poll.created_by,
+                'options': [{'id': o.id, 'text': o.text, 'votes': [v.user_id for v in sorted(o.votes, key=lambda v: v.id)]}
+                            for o in sorted(poll.options, key=lambda o: (o.sort_order, o.id))],
+            }
+    return [{
+        'id': m.id,
+        'user_id': m.user_id,
+        'content': m.content,
+        'card': m.card,
+        'message_type': m.message_type,
+        'is_system_message': m.is_system_message,
+        'referenced_task_id': m.referenced_task_id,
+        'created_at': m.created_at.isoformat(),
+        'reactions': reactions.get(m.id, []),
+        'poll': polls.get(m.id),
+    } for m in messages]
+
+
+def archive_channel_month(channel_id, start):
+    """
+    Move one channel-month into its archive block (merging with an existing
+    block for that month) in a single transaction. Returns messages moved.
+    """
+    messages = Message.query.filter(
+        Message.channel_id == channel_id, Message.created_at >= start, Message.created_at < _next_month(start)
+    ).order_by(Message.id).all()
+    if not messages:
+        return 0
+
+    month = start.strftime('%Y-%m')
+    records = _records_for(messages)
+    block = MessageArchiveBlock.query.filter_by(channel_id=channel_id, month=month).first()
+    if block:
+        known = {r['id'] for r in records}
+        records = sorted([r for r in unpack(block.payload) if r['id'] not in known] + records, key=lambda r: r['id'])
+    else:
+        block = MessageArchiveBlock(channel_id=channel_id, month=month)
+        db.session.add(block)
+    block.payload = pack(records)
+    block.first_message_id = records[0]['id']
+    block.last_message_id = records[-1]['id']
+    block.message_count = len(records)
+
+    # purge does no bookkeeping: take the rows out of unread counts and the payload cache here
+    ids = [m.id for m in messages]
+    UnreadService.unbump_many(ids)
+    MessageService.purge(ids)
+    gone = set(ids)
+    after_commit(message_cache().evict, lambda key: key[0] in gone)
+    db.session.commit()
+    return len(messages)
+
+
+def archive_older_than(days, channel_id=None, progress=None):
+    """
+    Archive every whole month older than `days`, one channel-month per
+    transaction so the hot table is never locked for long.
+    Returns (blocks written, messages moved).
+    """
+    cutoff = cutoff_for(days)
+    channel_ids = [channel_id] if channel_id else [cid for (cid,) in db.session.query(Message.channel_id).distinct()]
+    blocks = moved = 0
+    for cid in channel_ids:
+        while True:
+            oldest = db.session.query(Message.created_at).filter(
+                Message.channel_id == cid, Message.created_at < cutoff).order_by(Message.id).first()
+            if not oldest:
+                break
+            start = _month_start(oldest[0])
+            n = archive_channel_month(cid, start)
+            blocks, moved = blocks + 1, moved + n
+            if progress:
+                progress(cid, start.strftime('%Y-%m'), n)
+    return blocks, moved
+
+
+# ─── Reading ───
+def load_page(channel_id, before_id, limit, viewer):
+    """
+    The newest `limit` archived messages of a channel with id < before_id
+    (None = no bound), serialized like MessageService.serialize_page and
+    flagged 'archived'. Only the blocks needed to fill the page are inflated.
+    """
+    query = db.session.query(MessageArchiveBlock.id).filter(MessageArchiveBlock.channel_id == channel_id)
+    if before_id:
+        query = query.filter(MessageArchiveBlock.first_message_id < before_id)
+    records = []
+    for (block_id,) in query.order_by(MessageArchiveBlock.last_message_id.desc()):
+        block_records = unpack(db.session.get(MessageArchiveBlock, block_id).payload)
+        records = [r for r in block_records if not before_id or r['id'] < before_id] + records
+        if len(records) >= limit:
+            break
+    return serialize_records(records[-limit:], viewer) if records else []
+
+
+def serialize_records(records, viewer):
+    """Archived records -> chat JSON, with authors, tasks and voters looked up in one query each."""
+    user_ids = {r['user_id'] for r in records}
+    for r in records:
+        if r['poll']:
+            user_ids.update(uid for o in r['poll']['options'] for uid in o['votes'])
+    users = {u.id: u for u in User.query.filter(User.id.in_(user_ids)).all()} if user_ids else {}
+    task_ids = {r['referenced_task_id'] for r in records if r['referenced_task_id']}
+    tasks = {t.id: t for t in Task.query.filter(Task.id.in_(task_ids)).all()} if task_ids else {}
+
+    result = []
+    for r in records:
+        reactions, own = {}, set()
+        for user_id, emoji in r['reactions']:
+            reactions.setdefault(emoji, {'count': 0})['count'] += 1
+            if user_id == viewer.id:
+                own.add(emoji)
+
+        poll_data = None
+        if r['poll']:
+            p = r['poll']
+            votes_by_option = {o['id']: [{'id': uid, 'name': users[uid].name} for uid in o['votes'] if uid in users] for o in p['options']}
+            poll_data = MessageService.poll_payload(p['id'], p['question'], False, [(o['id'], o['text']) for o in p['options']], votes_by_option)
+
+        shared = MessageService.message_payload(
+            r['id'], r['user_id'], r['content'], r['card'], r['message_type'], datetime.fromisoformat(r['created_at']),
+            users.get(r['user_id']), tasks.get(r['referenced_task_id']), reactions, poll_data)
+        payload = MessageService.with_viewer(shared, own, viewer)
+        payload['archived'] = True
+        result.append(payload)
+    return result
@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash
 from models import db, User, Channel, ChannelMember
-from helpers import get_current_user, generate_unique_id, get_random_color
+from helpers import get_current_user, generate_unique_id, get_random_color, user_record_changed
+from presence import get_tracker as presence
+from passwords import HasherBusy, get_hasher as hasher, get_throttle as throttle
 
 auth = Blueprint('auth', __name__)
 
@@ -15,14 +17,29 @@ def login():
         email = request.form.get('email', '').strip().lower()
         password = request.form.get('password', '')
 
+        if throttle().blocked(email, request.remote_addr):
+            flash('Too many failed sign-ins. Please wait a few minutes and try again.', 'error')
+            return render_template('login.html'), 429
+
         user = User.query.filter_by(email=email).first()
-        if user and check_password_hash(user.password_hash, password):
+        try:
+            valid = user is not None and hasher().verify(user.password_hash, password)
+        except HasherBusy:
+            flash('Lots of people are signing in right now. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+
+        if valid:
+            throttle().succeeded(email)
+            if hasher().needs_rehash(user.password_hash):
+                upgrade_password_hash(user, password)
             session['user_id'] = user.id
+            session['user_version'] = user.record_version
             session['user_role'] = user.role
             session['user_name'] = user.name
             flash(f'Welcome back, {user.name}!', 'success')
             return redirect(url_for('views.dashboard'))
         else:
+            throttle().failed(email, request.remote_addr)
             flash('Invalid email or password.', 'error')
 
     return render_template('login.html')
@@ -40,12 +57,20 @@ def change_password():
     if not current_password or not new_password:
         return jsonify({'error': 'Missing fields'}), 400
         
-    user = User.query.get(session['user_id'])
-    if not check_password_hash(user.password_hash, current_password):
-        return jsonify({'error': 'Incorrect current password'}), 400
-        
+    user = get_current_user()
+    if throttle().blocked(user.email, request.remote_addr):
+        return jsonify({'error': 'Too many failed attempts, try again later'}), 429
+    try:
+        if not hasher().verify(user.password_hash, current_password):
+            throttle().failed(user.email, request.remote_addr)
+            return jsonify({'error': 'Incorrect current password'}), 400
+        new_hash = hasher().hash(new_password)
+    except HasherBusy:
+        return jsonify({'error': 'Server busy, try again in a moment'}), 503, {'Retry-After': '5'}
+
     try:
-        user.password_hash = generate_password_hash(new_password)
+        user.password_hash = new_hash
+        user_record_changed(user)
         db.session.add(user) # Explicitly mark as modified
         db.session.commit()
         print(f"✓ [AUTH] Password successfully updated for user: {user.email}")
@@ -56,8 +81,26 @@ def change_password():
         return jsonify({'error': 'Database error occurred'}), 500
 
 
+def upgrade_password_hash(user, password):
+    """
+    Re-hash a password whose stored hash predates the current method/cost,
+    right after it was verified. Skipped (until the next sign-in) when the
+    hashing pool is busy; the UPDATE is conditional on the old hash so a
+    concurrent password change wins.
+    """
+    old_hash = user.password_hash
+    try:
+        new_hash = hasher().hash(password)
+    except HasherBusy:
+        return
+    User.query.filter_by(id=user.id, password_hash=old_hash).update({'password_hash': new_hash}, synchronize_session=False)
+    db.session.commit()
+
+
 @auth.route('/logout')
 def logout():
+    if 'user_id' in session:
+        presence().leave(session['user_id'])
     session.clear()
     flash('You have been logged out.', 'info')
     return redirect(url_for('auth.login'))
@@ -65,7 +108,7 @@ def logout():
 
 def seed_default_user():
     """Create a default JSec user if no users exist."""
-    if User.query.count() == 0:
+    if db.session.query(User.id).count() == 0:
         default_user = User(
             unique_id='IIC-0001',
             name='Admin JSec',
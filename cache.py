@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU map with an optional per-entry TTL.
+    One instance per worker process; entries are plain Python objects that
+    callers must treat as read-only.
+    """
+
+    def __init__(self, maxsize=5000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get_many(self, keys):
+        """Return {key: value} for the keys present and fresh, marking them recently used."""
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None or (self.ttl and now - entry[0] > self.ttl):
+                    if entry is not None:
+                        del self._data[key]
+                    self.misses += 1
+                    continue
+                self._data.move_to_end(key)
+                found[key] = entry[1]
+                self.hits += 1
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items):
+        now = time.monotonic()
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (now, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def evict(self, predicate):
+        """Drop every entry whose key matches `predicate`."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def evict_items(self, predicate):
+        """Drop every entry for which `predicate(key, value)` holds."""
+        with self._lock:
+            for key in [k for k, (_, v) in self._data.items() if predicate(k, v)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def init_cache(app):
+    app.extensions['message_cache'] = LRUCache(
+        maxsize=app.config.get('MESSAGE_CACHE_SIZE', 5000),
+        ttl=app.config.get('MESSAGE_CACHE_TTL', 120),
+    )
+    app.extensions['channel_list_cache'] = LRUCache(
+        maxsize=app.config.get('CHANNEL_LIST_CACHE_SIZE', 2000),
+        ttl=app.config.get('CHANNEL_LIST_CACHE_TTL', 60),
+    )
+    app.extensions['user_cache'] = LRUCache(
+        maxsize=app.config.get('USER_CACHE_SIZE', 5000),
+        ttl=app.config.get('USER_CACHE_TTL', 60),
+    )
+    app.extensions['membership_cache'] = LRUCache(
+        maxsize=app.config.get('MEMBERSHIP_CACHE_SIZE', 5000),
+        ttl=app.config.get('MEMBERSHIP_CACHE_TTL', 30),
+    )
+
+
+def message_cache():
+    """Shared part of serialized chat messages, keyed by (message_id, version)."""
+    return current_app.extensions['message_cache']
+
+
+def channel_list_cache():
+    """Each user's sidebar channel list, keyed by user id; see ChannelListService."""
+    return current_app.extensions['channel_list_cache']
+
+
+def membership_cache():
+    """Each user's channel memberships, keyed by user id; see MembershipService."""
+    return current_app.extensions['membership_cache']
+
+
+def user_cache():
+    """Slim records of signed-in users, keyed by (user_id, record_version); see helpers.current_user_record."""
+    return current_app.extensions['user_cache']
@@ -0,0 +1,273 @@
+import random
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, User, Channel, ChannelMember, Message, ChannelChange, NotificationJob, Notification
+from services import ChangeFeed, ReactionService, MessageService, MembershipService
+import search as search_index
+from query_plans import check_query_plans
+import archive
+import wire
+import passwords
+import fanout
+
+
+@click.command('prune-changes')
+@with_appcontext
+@click.option('--days', default=30, show_default=True, help='Keep change-feed entries newer than this.')
+def prune_changes(days):
+    """Trim the channel change feed. Clients behind the cutoff get reset=True and reload."""
+    removed = ChangeFeed.prune(days)
+    click.echo(f'✓ Pruned {removed} change-feed entries older than {days} days')
+
+
+@click.command('reconcile-reactions')
+@with_appcontext
+def reconcile_reactions():
+    """Backfill / rebuild message_reaction_counts from message_reactions."""
+    rows = ReactionService.reconcile()
+    click.echo(f'✓ Rebuilt {rows} reaction counters')
+
+
+@click.command('search-backfill')
+@with_appcontext
+@click.option('--chunk-size', default=1000, show_default=True, help='Messages indexed per transaction.')
+@click.option('--rebuild', is_flag=True, help='Empty the index first.')
+def search_backfill(chunk_size, rebuild):
+    """Index existing chat history for /api/search, in short chunks."""
+    if not search_index.enabled():
+        raise click.ClickException('Full-text search is not available on this database')
+    total = search_index.backfill(chunk_size, rebuild=rebuild,
+                                  progress=lambda n, last_id: click.echo(f'  … {n} indexed (up to message {last_id})'))
+    click.echo(f'✓ Indexed {total} messages')
+
+
+@click.command('check-query-plans')
+@with_appcontext
+@click.option('--verbose', '-v', is_flag=True, help='Print every plan, not just failures.')
+def check_query_plans_command(verbose):
+    """EXPLAIN the hot API queries and fail if any falls back to a full table scan."""
+    failed = 0
+    for r in check_query_plans():
+        ok = not r['full_scans']
+        failed += not ok
+        click.echo(f"{'✓' if ok else '✗'} {r['name']}" + ('' if ok else f" (full scan: {', '.join(r['full_scans'])})"))
+        if verbose or not ok:
+            for line in r['plan']:
+                click.echo(f'    {line}')
+    if failed:
+        raise click.ClickException(f'{failed} queries regressed to a full table scan')
+
+
+@click.command('archive-messages')
+@with_appcontext
+@click.option('--days', type=int, default=None, help='Archive whole months older than this (default: ARCHIVE_AFTER_DAYS).')
+@click.option('--channel', 'channel_id', type=int, default=None, help='Only this channel.')
+def archive_messages(days, channel_id):
+    """Move old messages, with their reactions and polls, into compressed per-channel-month blocks."""
+    days = days if days is not None else current_app.config['ARCHIVE_AFTER_DAYS']
+    blocks, moved = archive.archive_older_than(days, channel_id=channel_id,
+                                               progress=lambda cid, month, n: click.echo(f'  … channel {cid} {month}: {n} messages'))
+    click.echo(f'✓ Archived {moved} messages into {blocks} blocks (cutoff {archive.cutoff_for(days):%Y-%m-%d})')
+
+
+@click.command('bench-wire')
+@with_appcontext
+@click.option('--user', 'user_id', type=int, default=None, help='Fetch as this user (default: the first JSec).')
+@click.option('--seed', 'seed_messages', type=int, default=0, help='Post this many synthetic messages to a scratch channel first; removed afterwards.')
+@click.option('--repeat', default=5, show_default=True, help='Encode runs per cell; the fastest is reported.')
+def bench_wire(user_id, seed_messages, repeat):
+    """Bytes and encode time per API endpoint for each body format and compression."""
+    user = db.session.get(User, user_id) if user_id else User.query.filter_by(role='jsec').order_by(User.id).first()
+    if not user:
+        raise click.ClickException('No such user')
+
+    scratch = None
+    if seed_messages:
+        scratch = Channel(name='bench-wire', description='scratch channel for flask bench-wire', is_private=True, created_by=user.id)
+        db.session.add(scratch)
+        db.session.flush()
+        db.session.add(ChannelMember(channel_id=scratch.id, user_id=user.id, added_by=user.id))
+        words = 'the club meeting agenda task deadline event robotics workshop slides budget venue poster'.split()
+        db.session.execute(db.insert(Message), [
+            {'channel_id': scratch.id, 'user_id': user.id, 'content': ' '.join(random.choices(words, k=random.randint(3, 40)))}
+            for _ in range(seed_messages)])
+        db.session.commit()
+    channel_id = scratch.id if scratch else db.session.query(ChannelMember.channel_id).filter_by(user_id=user.id).scalar()
+
+    paths = ['/api/messages/%d?limit=100' % channel_id, '/api/tasks', '/api/channels', '/api/members']
+    try:
+        rows = wire.benchmark(paths, user.id, repeat=repeat)
+    finally:
+        if scratch:
+            MessageService.purge([mid for (mid,) in db.session.query(Message.id).filter_by(channel_id=scratch.id)])
+            ChannelMember.query.filter_by(channel_id=scratch.id).delete()
+            db.session.delete(scratch)
+            db.session.commit()
+
+    click.echo(f"{'endpoint':<32} {'format':<8} {'coding':<9} {'bytes':>9} {'encode ms':>10}")
+    for r in rows:
+        click.echo(f"{r['path']:<32} {r['format']:<8} {r['coding']:<9} {r['bytes']:>9} {r['encode_ms']:>10.3f}")
+    missing = [name for name, mod in (('brotli', wire.brotli), ('msgpack', wire.msgpack)) if not mod]
+    if missing:
+        click.echo(f"  (not installed: {', '.join(missing)})")
+
+
+@click.command('bench-membership')
+@with_appcontext
+@click.option('--members', default=5000, show_default=True, help='Users to add; synthetic ones are created to reach it and removed afterwards.')
+def bench_membership(members):
+    """Time adding everyone to a channel: one query per user vs MembershipService.add."""
+    creator = User.query.filter_by(role='jsec').order_by(User.id).first()
+    if not creator:
+        raise click.ClickException('No JSec user to own the scratch channels')
+    missing = max(0, members - User.query.count())
+    tag = f'bench-{random.randrange(16 ** 6):06x}'
+    if missing:
+        db.session.execute(db.insert(User), [
+            {'unique_id': f'{tag}-{i}', 'name': f'Bench {i}', 'email': f'{tag}-{i}@bench.invalid', 'password_hash': '!', 'role': 'member'}
+            for i in range(missing)])
+    scratch = [Channel(name=f'{tag}-{kind}', description='scratch channel for flask bench-membership', is_private=True, created_by=creator.id)
+               for kind in ('loop', 'bulk')]
+    db.session.add_all(scratch)
+    db.session.commit()
+
+    try:
+        start = time.perf_counter()
+        for u in User.query.all():
+            if not ChannelMember.query.filter_by(channel_id=scratch[0].id, user_id=u.id).first():
+                db.session.add(ChannelMember(channel_id=scratch[0].id, user_id=u.id))
+        db.session.commit()
+        loop_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        added = MembershipService.add(scratch[1].id)
+        db.session.commit()
+        bulk_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        MembershipService.add(scratch[1].id)
+        db.session.commit()
+        noop_s = time.perf_counter() - start
+    finally:
+        ids = [c.id for c in scratch]
+        ChannelMember.query.filter(ChannelMember.channel_id.in_(ids)).delete(synchronize_session=False)
+        Channel.query.filter(Channel.id.in_(ids)).delete(synchronize_session=False)
+        User.query.filter(User.unique_id.like(f'{tag}-%')).delete(synchronize_session=False)
+        db.session.commit()
+
+    click.echo(f'{len(added)} members')
+    click.echo(f'  per-user loop        {loop_s * 1000:>9.1f} ms')
+    click.echo(f'  INSERT ... SELECT    {bulk_s * 1000:>9.1f} ms  ({loop_s / bulk_s:.0f}x)')
+    click.echo(f'  again (nothing new)  {noop_s * 1000:>9.1f} ms')
+
+
+@click.command('bench-fanout')
+@with_appcontext
+@click.option('--members', default=2000, show_default=True, help='Channel size; synthetic users are created to reach it and removed afterwards.')
+@click.option('--messages', default=5, show_default=True, help='@all messages posted per mode.')
+def bench_fanout(members, messages):
+    """Post @all to a large channel: send latency and notification throughput, fan-out in the background vs inline."""
+    creator = User.query.filter_by(role='jsec').order_by(User.id).first()
+    if not creator:
+        raise click.ClickException('No JSec user to post the messages')
+    missing = max(0, members - User.query.count())
+    tag = f'bench-{random.randrange(16 ** 6):06x}'
+    if missing:
+        db.session.execute(db.insert(User), [
+            {'unique_id': f'{tag}-{i}', 'name': f'Bench {i}', 'email': f'{tag}-{i}@bench.invalid', 'password_hash': '!', 'role': 'member'}
+            for i in range(missing)])
+    scratch = Channel(name=tag, description='scratch channel for flask bench-fanout', is_private=True, created_by=creator.id)
+    db.session.add(scratch)
+    db.session.flush()
+    MembershipService.add(scratch.id, User.id.in_(db.session.query(User.id).order_by(User.id).limit(members)))
+    MembershipService.add(scratch.id, User.id == creator.id)
+    db.session.commit()
+    channel_id, size = scratch.id, ChannelMember.query.filter_by(channel_id=scratch.id).count()
+
+    app = current_app._get_current_object()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = creator.id
+    configured = app.extensions['fanout']
+    background = configured or fanout.FanoutWorker(app, max_workers=4)
+    rows = []
+    try:
+        for mode, worker in (('background', background), ('inline', None)):
+            app.extensions['fanout'] = worker
+            sends, ids = [], []
+            start = time.perf_counter()
+            for i in range(messages):
+                sent = time.perf_counter()
+                with app.app_context():  # a request of its own (g, session), not the command's context
+                    response = client.post(f'/api/messages/{channel_id}/send', json={'content': f'@all {mode} bench {i}'})
+                sends.append(time.perf_counter() - sent)
+                if response.status_code != 200:
+                    raise click.ClickException(f'Send failed: HTTP {response.status_code}')
+                ids.append(response.get_json()['id'])
+            while NotificationJob.query.filter(NotificationJob.message_id.in_(ids), NotificationJob.status.in_(('pending', 'running'))).first():
+                db.session.remove()
+                time.sleep(0.02)
+            elapsed = time.perf_counter() - start
+            notified = Notification.query.filter(Notification.message_id.in_(ids)).count()
+            rows.append((mode, sorted(sends), elapsed, notified))
+    finally:
+        app.extensions['fanout'] = configured
+        if background is not configured:
+            background.executor.shutdown(wait=True)
+        db.session.remove()
+        MessageService.purge([mid for (mid,) in db.session.query(Message.id).filter_by(channel_id=channel_id)])
+        ChannelChange.query.filter_by(channel_id=channel_id).delete(synchronize_session=False)
+        ChannelMember.query.filter_by(channel_id=channel_id).delete(synchronize_session=False)
+        Channel.query.filter_by(id=channel_id).delete(synchronize_session=False)
+        User.query.filter(User.unique_id.like(f'{tag}-%')).delete(synchronize_session=False)
+        db.session.commit()
+
+    click.echo(f'{size} members, {messages} @all messages per mode')
+    click.echo(f"{'mode':<11} {'send p50 ms':>12} {'send max ms':>12} {'done in s':>10} {'notifications/s':>16}")
+    for mode, sends, elapsed, notified in rows:
+        click.echo(f"{mode:<11} {sends[len(sends) // 2] * 1000:>12.1f} {sends[-1] * 1000:>12.1f} {elapsed:>10.2f} {notified / elapsed:>16.0f}")
+
+
+@click.command('bench-login')
+@with_appcontext
+@click.option('--logins', default=300, show_default=True, help='Synthetic accounts to sign in; removed afterwards.')
+@click.option('--concurrency', default=16, show_default=True, help='Sign-ins in flight at once.')
+@click.option('--user', 'user_id', type=int, default=None, help='Poll /api/sync as this user (default: the first JSec).')
+def bench_login(logins, concurrency, user_id):
+    """Sign-in storm: logins per second per core and chat poll latency, hashing inline vs the password pool."""
+    user = db.session.get(User, user_id) if user_id else User.query.filter_by(role='jsec').order_by(User.id).first()
+    if not user:
+        raise click.ClickException('No such user')
+    tag = f'bench-{random.randrange(16 ** 6):06x}'
+    password = tag
+    password_hash = passwords.get_hasher().hash(password)
+    accounts = [f'{tag}-{i}@bench.invalid' for i in range(logins)]
+    db.session.execute(db.insert(User), [
+        {'unique_id': f'{tag}-{i}', 'name': f'Bench {i}', 'email': email, 'password_hash': password_hash, 'role': 'member'}
+        for i, email in enumerate(accounts)])
+    db.session.commit()
+
+    try:
+        rows = passwords.benchmark(accounts, password, user.id, concurrency=concurrency)
+    finally:
+        User.query.filter(User.unique_id.like(f'{tag}-%')).delete(synchronize_session=False)
+        db.session.commit()
+
+    click.echo(f"{'mode':<8} {'ok':>5} {'503':>5} {'seconds':>8} {'logins/s':>9} {'per core':>9} {'polls':>6} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for r in rows:
+        click.echo(f"{r['mode']:<8} {r['ok']:>5} {r['busy']:>5} {r['seconds']:>8.2f} {r['per_second']:>9.1f} {r['per_core']:>9.1f} "
+                   f"{r['polls']:>6} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['max_ms']:>8.1f}")
+
+
+def register_commands(app):
+    app.cli.add_command(prune_changes)
+    app.cli.add_command(reconcile_reactions)
+    app.cli.add_command(search_backfill)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(archive_messages)
+    app.cli.add_command(bench_wire)
+    app.cli.add_command(bench_membership)
+    app.cli.add_command(bench_login)
+    app.cli.add_command(bench_fanout)
@@ -0,0 +1,197 @@
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, union, insert, exists, literal
+from models import db, User, Message, Channel, ChannelMember, Notification, NotificationJob
+import realtime
+from mentions import get_index
+
+
+ROLE_MENTIONS = ('jsec', 'coordinator', 'member')
+
+
+def parse_mentions(content):
+    """
+    Split the @tokens in a message into role mentions and name mentions.
+    The token regex is greedy ("@all hello" -> "all hello"), so a token that
+    starts with a role keyword counts as that role.
+    """
+    roles, names = set(), set()
+    for token in set(re.findall(r"@([a-zA-Z0-9_ -]+)", content)):
+        token_clean = token.strip()
+        token_lower = token_clean.lower()
+        found_role = None
+        for r in ('all',) + ROLE_MENTIONS:
+            if token_lower == r or token_lower.startswith(r + ' '):
+                found_role = r
+                break
+        if found_role:
+            roles.add(found_role)
+        elif token_clean:
+            names.add(token_clean)
+    return roles, names
+
+
+def enqueue(msg):
+    """
+    Queue fan-out for a new message. Added to the current session so the job
+    commits atomically with the message; call `submit` after the commit.
+    Returns None when the message can't notify anyone.
+    """
+    if '@' not in msg.content and not _is_dm(msg.channel_id):
+        return None
+    job = NotificationJob(message_id=msg.id)
+    db.session.add(job)
+    return job
+
+
+def _is_dm(channel_id):
+    return db.session.query(Channel.channel_type).filter_by(id=channel_id).scalar() == 'dm'
+
+
+def fan_out(msg):
+    """
+    Insert every notification for a message with a single INSERT ... SELECT:
+    the audience is a UNION of channel members (@all / DMs), role holders and
+    users resolved through the mention index, minus the sender and anyone already notified.
+    Returns the ids of the users notified.
+    """
+    roles, names = parse_mentions(msg.content)
+    is_dm = _is_dm(msg.channel_id)
+
+    targets = []
+    if 'all' in roles or is_dm:
+        targets.append(select(ChannelMember.user_id.label('user_id')).where(ChannelMember.channel_id == msg.channel_id))
+    if roles - {'all'}:
+        targets.append(select(User.id.label('user_id')).where(User.role.in_(roles - {'all'})))
+    if names:
+        index = get_index()
+        ids = {uid for uid in (index.resolve(n) for n in names) if uid}
+        if ids:
+            targets.append(select(User.id.label('user_id')).where(User.id.in_(ids)))
+    if not targets:
+        return []
+
+    audience = (union(*targets) if len(targets) > 1 else targets[0]).subquery()
+    already = select(Notification.id).where(Notification.user_id == audience.c.user_id, Notification.message_id == msg.id)
+    source = select(audience.c.user_id, literal(msg.id), literal(False), literal(datetime.utcnow())).where(
+        audience.c.user_id != msg.user_id, ~exists(already))
+    db.session.execute(insert(Notification.__table__).from_select(['user_id', 'message_id', 'is_read', 'created_at'], source))
+
+    return [uid for (uid,) in db.session.query(Notification.user_id).filter(Notification.message_id == msg.id).all()]
+
+
+class FanoutWorker:
+    """
+    Thread pool that drains notification_jobs. Jobs are claimed with a
+    conditional UPDATE so several gunicorn workers can share the table, and
+    anything left pending (crash, lost submit) is picked up by the sweeper.
+    Subclasses can drain another job table by overriding `job_model`,
+    `stale_column` and `process`.
+    """
+    job_model = NotificationJob
+    stale_column = 'started_at'  # a running job untouched for 5 minutes is presumed dead
+    name = 'fanout'
+
+    def __init__(self, app, max_workers=4, max_attempts=3, sweep_interval=30):
+        self.app = app
+        self.max_attempts = max_attempts
+        self.sweep_interval = sweep_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=self.name)
+        self._sweeper = None
+        self._lock = threading.Lock()
+
+    def submit(self, job_id):
+        self._ensure_sweeper()
+        self.executor.submit(self._run, job_id)
+
+    def start(self):
+        """Start sweeping now instead of on the first submit, to pick up work left by a previous run."""
+        self._ensure_sweeper()
+
+    def _ensure_sweeper(self):
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_forever, name=f'{self.name}-sweeper', daemon=True)
+                self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.sweep()
+            except Exception as e:
+                print(f"✗ [{self.name.upper()}] Sweep failed: {e}")
+            time.sleep(self.sweep_interval)
+
+    def sweep(self):
+        """Resubmit pending jobs and reset ones stuck in 'running' (their worker died)."""
+        model = self.job_model
+        stale = datetime.utcnow() - timedelta(minutes=5)
+        model.query.filter(model.status == 'running', getattr(model, self.stale_column) < stale).update(
+            {'status': 'pending'}, synchronize_session=False)
+        db.session.commit()
+        for (job_id,) in db.session.query(model.id).filter_by(status='pending').order_by(model.id).all():
+            self.executor.submit(self._run, job_id)
+
+    def process(self, job_id):
+        process_job(job_id, self.max_attempts)
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            try:
+                self.process(job_id)
+            finally:
+                db.session.remove()
+
+
+def process_job(job_id, max_attempts=3):
+    """Claim and run one job. Safe to call twice for the same id: only one caller wins the claim."""
+    claimed = NotificationJob.query.filter_by(id=job_id, status='pending').update(
+        {'status': 'running', 'attempts': NotificationJob.attempts + 1, 'started_at': datetime.utcnow()},
+        synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return
+
+    job = NotificationJob.query.get(job_id)
+    try:
+        msg = Message.query.get(job.message_id)
+        notified = fan_out(msg) if msg else []
+        job.status = 'done'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        if msg:
+            realtime.publish_notifications(notified, msg.id)
+    except Exception as e:
+        db.session.rollback()
+        job = NotificationJob.query.get(job_id)
+        job.status = 'failed' if job.attempts >= max_attempts else 'pending'
+        job.error = str(e)
+        db.session.commit()
+        print(f"✗ [FANOUT] Job {job_id} failed (attempt {job.attempts}): {e}")
+
+
+def init_fanout(app):
+    """NOTIFY_WORKERS=0 runs fan-out inline in the request (tests, debugging)."""
+    workers = app.config.get('NOTIFY_WORKERS', 4)
+    worker = app.extensions['fanout'] = FanoutWorker(app, max_workers=workers) if workers else None
+    if worker:
+        with app.app_context():
+            # Jobs a crashed or restarted process left behind shouldn't wait for the next post
+            if NotificationJob.query.filter(NotificationJob.status.in_(('pending', 'running'))).first():
+                worker.start()
+
+
+def submit(job):
+    """Hand a committed job to the pool (or run it inline when the pool is disabled)."""
+    if job is None:
+        return
+    worker = current_app.extensions.get('fanout')
+    if worker:
+        worker.submit(job.id)
+    else:
+        process_job(job.id)
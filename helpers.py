@@ -1,21 +1,88 @@
+import re
 from functools import wraps
-from flask import session, redirect, url_for, flash, abort
+from flask import session, redirect, url_for, flash, abort, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from models import User, db
+from cache import user_cache
 
 
 def get_current_user():
-    """Get the currently logged-in user from session."""
+    """Get the currently logged-in user from session, loaded once per request and kept on flask.g."""
     user_id = session.get('user_id')
-    if user_id:
-        return User.query.get(user_id)
-    return None
+    if not user_id:
+        return None
+    if g.get('current_user_id') != user_id:
+        g.current_user = db.session.get(User, user_id)
+        g.current_user_id = user_id
+    return g.current_user
+
+
+ROLE_LEVELS = {'member': 1, 'coordinator': 2, 'jsec': 3}
+
+
+class UserRecord:
+    """The fields of the signed-in user that authorization and polling need; read-only, shared across requests."""
+    __slots__ = ('id', 'name', 'role', 'avatar_color', 'joined_at', 'version')
+
+    def __init__(self, user):
+        self.id = user.id
+        self.name = user.name
+        self.role = user.role
+        self.avatar_color = user.avatar_color
+        self.joined_at = user.joined_at
+        self.version = user.record_version
+
+    def role_level(self):
+        return ROLE_LEVELS.get(self.role, 0)
+
+
+def current_user_record():
+    """
+    Slim record of the signed-in user, from the per-worker cache keyed by
+    (user_id, record_version in the session); no query while it's warm.
+    Use it where the full row isn't needed (auth checks, polling APIs).
+    Returns None when signed out or the account is gone.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return None
+    record = g.get('current_user_record')
+    if record is not None and record.id == user_id:
+        return record
+
+    record = user_cache().get((user_id, session.get('user_version')))
+    if record is None:
+        user = get_current_user()
+        if user is None:
+            return None
+        record = UserRecord(user)
+        user_cache().put((record.id, record.version), record)
+        if session.get('user_version') != record.version:
+            session['user_version'] = record.version
+    g.current_user_record = record
+    return record
+
+
+def user_record_changed(user):
+    """
+    Call when editing a user's row, before committing: bumps its
+    record_version and drops this worker's cached records of it. The
+    editor's own session follows the new version at once; other sessions
+    pick it up on their next miss, and other workers within USER_CACHE_TTL.
+    """
+    user.record_version = (user.record_version or 0) + 1
+    user_cache().evict(lambda key: key[0] == user.id)
+    if session.get('user_id') == user.id:
+        session['user_version'] = user.record_version
 
 
 def login_required(f):
     """Decorator to require login for a route."""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if not current_user_record():
+            session.clear()
             flash('Please log in to access this page.', 'warning')
             return redirect(url_for('auth.login'))
         return f(*args, **kwargs)
@@ -26,25 +93,59 @@ def role_required(min_role):
     """Decorator to require a minimum role level.
     Hierarchy: jsec (3) > coordinator (2) > member (1)
     """
-    role_levels = {'member': 1, 'coordinator': 2, 'jsec': 3}
-
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if 'user_id' not in session:
                 flash('Please log in to access this page.', 'warning')
                 return redirect(url_for('auth.login'))
-            user = User.query.get(session['user_id'])
+            user = current_user_record()
             if not user:
                 flash('User not found.', 'error')
                 return redirect(url_for('auth.login'))
-            if user.role_level() < role_levels.get(min_role, 0):
+            if user.role_level() < ROLE_LEVELS.get(min_role, 0):
                 abort(403)
             return f(*args, **kwargs)
         return decorated_function
     return decorator
 
 
+# A single-row SELECT of users by primary key, however the ORM spelled it
+_USER_BY_PK = re.compile(r'\bFROM users\s+WHERE users\.id = ')
+
+
+def check_user_lookups(app):
+    """
+    With USER_LOOKUP_CHECK on, fail any request that selects the signed-in
+    user's row more than once, i.e. something bypassed get_current_user
+    (tests, debugging). Counts the SQL actually sent, so a stray
+    User.query.get(session['user_id']) is caught as well.
+    """
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context() or 'user_lookups' not in g:
+            return  # check off, or a background pool's query
+        user_id = session.get('user_id')
+        if user_id is None or not _USER_BY_PK.search(statement):
+            return
+        values = parameters.values() if isinstance(parameters, dict) else parameters
+        if user_id in values:
+            g.user_lookups += 1
+
+    def reset():
+        if app.config['USER_LOOKUP_CHECK']:
+            g.user_lookups = 0
+
+    def verify(response):
+        lookups = g.pop('user_lookups', 0)
+        if lookups > 1:
+            raise AssertionError(f'signed-in user loaded {lookups} times in one request')
+        return response
+
+    event.listen(Engine, 'before_cursor_execute', count)
+    app.before_request(reset)
+    app.after_request(verify)
+
+
 def generate_unique_id():
     """Generate the next unique member ID (IIC-0001 format)."""
     last_user = User.query.order_by(User.id.desc()).first()
@@ -68,3 +169,12 @@ def get_random_color():
     """Get a random avatar color."""
     import random
     return random.choice(AVATAR_COLORS)
+
+
+MOM_PREVIEW_CHARS = 600
+
+
+def mom_preview(mom):
+    """Leading slice of meeting minutes for chat cards; the event page has the full text."""
+    mom = (mom or '').strip()
+    return mom if len(mom) <= MOM_PREVIEW_CHARS else mom[:MOM_PREVIEW_CHARS].rstrip() + '…'
@@ -0,0 +1,125 @@
+import bisect
+import threading
+import time
+from flask import current_app
+from models import db, User
+
+
+# Role keywords offered ahead of people, in this order
+ROLE_KEYWORDS = [
+    ('all', 'Notify Everyone'),
+    ('jsec', 'Notify JSecs'),
+    ('coordinator', 'Notify Coordinators'),
+    ('member', 'Notify Members'),
+]
+
+
+class MentionIndex:
+    """
+    Sorted-array prefix index over user names, used for @mention resolution
+    and typeahead without touching the users table.
+    Every word of a name is indexed, so "gar" finds "Aadit Garg".
+    Each worker keeps its own copy: edits made in this worker update it
+    directly, and it is rebuilt after `max_age` seconds to pick up edits
+    made elsewhere.
+    """
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()  # one rebuild at a time; held apart from _lock so reads go on
+        self._keys = []  # sorted (lowercased name suffix, user_id)
+        self._users = {}  # user_id -> {'id', 'name', 'role', 'avatar_color'}
+        self._built_at = 0
+
+    def build(self):
+        rows = db.session.query(User.id, User.name, User.role, User.avatar_color).all()
+        users = {uid: {'id': uid, 'name': name, 'role': role, 'avatar_color': color} for uid, name, role, color in rows}
+        keys = sorted(k for u in users.values() for k in self._keys_for(u))
+        with self._lock:
+            self._users, self._keys = users, keys
+            self._built_at = time.monotonic()
+
+    @staticmethod
+    def _keys_for(u):
+        words = u['name'].lower().split()
+        return [(' '.join(words[i:]), u['id']) for i in range(len(words))]
+
+    def _stale(self):
+        return time.monotonic() - self._built_at > self.max_age
+
+    def _fresh(self):
+        """Rebuild once expired; while one thread rebuilds, the others serve the old snapshot."""
+        if not self._stale() or not self._rebuild_lock.acquire(blocking=False):
+            return
+        try:
+            if self._stale():  # another thread may have just finished
+                self.build()
+        finally:
+            self._rebuild_lock.release()
+
+    def upsert(self, user):
+        """Add or refresh one user after an insert/edit (call after commit)."""
+        u = {'id': user.id, 'name': user.name, 'role': user.role, 'avatar_color': user.avatar_color}
+        with self._lock:
+            self._remove_locked(user.id)
+            self._users[user.id] = u
+            for k in self._keys_for(u):
+                bisect.insort(self._keys, k)
+
+    def remove(self, user_id):
+        with self._lock:
+            self._remove_locked(user_id)
+
+    def _remove_locked(self, user_id):
+        old = self._users.pop(user_id, None)
+        if old:
+            for k in self._keys_for(old):
+                i = bisect.bisect_left(self._keys, k)
+                if i < len(self._keys) and self._keys[i] == k:
+                    del self._keys[i]
+
+    def suggest(self, prefix, limit=8, roles=True):
+        """Role keywords then users whose name (or any later word of it) starts with `prefix`."""
+        self._fresh()
+        q = prefix.lower().strip()
+        out = [{'id': kw, 'name': kw, 'role': label} for kw, label in ROLE_KEYWORDS if roles and kw.startswith(q)]
+        seen = set()
+        with self._lock:
+            i = bisect.bisect_left(self._keys, (q,))
+            while i < len(self._keys) and len(out) < limit and self._keys[i][0].startswith(q):
+                uid = self._keys[i][1]
+                if uid not in seen:
+                    seen.add(uid)
+                    out.append(dict(self._users[uid]))
+                i += 1
+        return out[:limit]
+
+    def resolve(self, token):
+        """
+        Map a greedy @token ("Aadit Garg thanks") to the user whose full name is
+        its longest leading run of words. Returns the user id or None.
+        """
+        self._fresh()
+        words = token.lower().split()
+        with self._lock:
+            for n in range(len(words), 0, -1):
+                candidate = ' '.join(words[:n])
+                i = bisect.bisect_left(self._keys, (candidate,))
+                while i < len(self._keys) and self._keys[i][0] == candidate:
+                    uid = self._keys[i][1]
+                    if self._users[uid]['name'].lower() == candidate:
+                        return uid
+                    i += 1
+        return None
+
+
+def init_mentions(app):
+    index = MentionIndex()
+    app.extensions['mentions'] = index
+    with app.app_context():
+        index.build()
+
+
+def get_index():
+    return current_app.extensions['mentions']
@@ -0,0 +1,47 @@
+"""Add batched bulk-purge moderation jobs
+
+Revision ID: 2d6f8b0c4e17
+Revises: 9c1e4a7b3d62
+Create Date: 2026-10-17 10:11:05.772913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d6f8b0c4e17'
+down_revision = '9c1e4a7b3d62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all may already have made the table
+    if not sa.inspect(op.get_bind()).has_table('moderation_jobs'):
+        op.create_table('moderation_jobs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('requested_by', sa.Integer(), nullable=True),
+            sa.Column('channel_id', sa.Integer(), nullable=True),
+            sa.Column('author_id', sa.Integer(), nullable=True),
+            sa.Column('since', sa.DateTime(), nullable=True),
+            sa.Column('until', sa.DateTime(), nullable=True),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('batch_size', sa.Integer(), nullable=True),
+            sa.Column('total', sa.Integer(), nullable=True),
+            sa.Column('deleted_count', sa.Integer(), nullable=True),
+            sa.Column('last_message_id', sa.Integer(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['requested_by'], ['users.id'], ondelete='SET NULL'),
+            sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('ix_moderation_jobs_status', 'moderation_jobs', ['status'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_moderation_jobs_status', table_name='moderation_jobs', if_exists=True)
+    op.drop_table('moderation_jobs')
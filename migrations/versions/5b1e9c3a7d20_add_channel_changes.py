@@ -0,0 +1,37 @@
+"""Add the per-channel change feed
+
+Revision ID: 5b1e9c3a7d20
+Revises: a4d7e2b9c615
+Create Date: 2026-10-17 09:12:40.381206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e9c3a7d20'
+down_revision = 'a4d7e2b9c615'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all may already have made the table
+    if not sa.inspect(op.get_bind()).has_table('channel_changes'):
+        op.create_table('channel_changes',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('channel_id', sa.Integer(), nullable=False),
+            sa.Column('message_id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(length=20), nullable=False),
+            sa.Column('payload', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['channel_id'], ['channels.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('ix_channel_changes_channel_id_id', 'channel_changes', ['channel_id', 'id'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_channel_changes_channel_id_id', table_name='channel_changes', if_exists=True)
+    op.drop_table('channel_changes')
@@ -0,0 +1,40 @@
+"""Add reaction counters and fill them from existing reactions
+
+Revision ID: 6d2f0a4b8e31
+Revises: 5b1e9c3a7d20
+Create Date: 2026-10-17 09:14:02.577193
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d2f0a4b8e31'
+down_revision = '5b1e9c3a7d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # The app's create_all may already have made the (empty) table
+    if not sa.inspect(bind).has_table('message_reaction_counts'):
+        op.create_table('message_reaction_counts',
+            sa.Column('message_id', sa.Integer(), nullable=False),
+            sa.Column('emoji', sa.String(length=10), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('message_id', 'emoji')
+        )
+
+    # Same rebuild as `flask reconcile-reactions`, unless the counters are already in use
+    if bind.execute(sa.text('SELECT 1 FROM message_reaction_counts LIMIT 1')).first() is None:
+        bind.execute(sa.text(
+            'INSERT INTO message_reaction_counts (message_id, emoji, count, created_at) '
+            'SELECT message_id, emoji, COUNT(id), MIN(created_at) FROM message_reactions GROUP BY message_id, emoji'))
+
+
+def downgrade():
+    op.drop_table('message_reaction_counts')
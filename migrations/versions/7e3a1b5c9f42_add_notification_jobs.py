@@ -0,0 +1,39 @@
+"""Add the notification fan-out job queue
+
+Revision ID: 7e3a1b5c9f42
+Revises: 6d2f0a4b8e31
+Create Date: 2026-10-17 09:16:27.904512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e3a1b5c9f42'
+down_revision = '6d2f0a4b8e31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all may already have made the table
+    if not sa.inspect(op.get_bind()).has_table('notification_jobs'):
+        op.create_table('notification_jobs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('message_id', sa.Integer(), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=True),
+            sa.Column('attempts', sa.Integer(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('ix_notification_jobs_status', 'notification_jobs', ['status'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_notification_jobs_status', table_name='notification_jobs', if_exists=True)
+    op.drop_table('notification_jobs')
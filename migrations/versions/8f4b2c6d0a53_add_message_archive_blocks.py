@@ -0,0 +1,43 @@
+"""Add compressed channel-month message archive blocks
+
+Revision ID: 8f4b2c6d0a53
+Revises: 7e3a1b5c9f42
+Create Date: 2026-10-17 09:18:51.160734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f4b2c6d0a53'
+down_revision = '7e3a1b5c9f42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all may already have made the table
+    if not sa.inspect(op.get_bind()).has_table('message_archive_blocks'):
+        op.create_table('message_archive_blocks',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('channel_id', sa.Integer(), nullable=False),
+            sa.Column('month', sa.String(length=7), nullable=False),
+            sa.Column('first_message_id', sa.Integer(), nullable=False),
+            sa.Column('last_message_id', sa.Integer(), nullable=False),
+            sa.Column('message_count', sa.Integer(), nullable=True),
+            sa.Column('payload', sa.LargeBinary(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['channel_id'], ['channels.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('channel_id', 'month')
+        )
+    op.create_index('ix_message_archive_blocks_channel_id_last', 'message_archive_blocks', ['channel_id', 'last_message_id'],
+                    unique=False, if_not_exists=True)
+
+
+def downgrade():
+    # Archived messages exist only in these blocks: this drops that history with them
+    op.drop_index('ix_message_archive_blocks_channel_id_last', table_name='message_archive_blocks', if_exists=True)
+    op.drop_table('message_archive_blocks')
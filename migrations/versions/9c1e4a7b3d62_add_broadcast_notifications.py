@@ -0,0 +1,53 @@
+"""Add broadcast notifications stored once per announcement
+
+Revision ID: 9c1e4a7b3d62
+Revises: 8f4b2c6d0a53
+Create Date: 2026-10-17 10:02:37.418265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1e4a7b3d62'
+down_revision = '8f4b2c6d0a53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The app's create_all may already have made the tables
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('broadcast_notifications'):
+        op.create_table('broadcast_notifications',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('message_id', sa.Integer(), nullable=False),
+            sa.Column('sender_id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['sender_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+    op.create_index('ix_broadcast_notifications_created_at', 'broadcast_notifications', ['created_at'],
+                    unique=False, if_not_exists=True)
+    op.create_index('ix_broadcast_notifications_message_id', 'broadcast_notifications', ['message_id'],
+                    unique=False, if_not_exists=True)
+    if not inspector.has_table('broadcast_dismissals'):
+        op.create_table('broadcast_dismissals',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('broadcast_id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['broadcast_id'], ['broadcast_notifications.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('broadcast_id', 'user_id')
+        )
+
+
+def downgrade():
+    op.drop_table('broadcast_dismissals')
+    op.drop_index('ix_broadcast_notifications_message_id', table_name='broadcast_notifications', if_exists=True)
+    op.drop_index('ix_broadcast_notifications_created_at', table_name='broadcast_notifications', if_exists=True)
+    op.drop_table('broadcast_notifications')
@@ -0,0 +1,26 @@
+"""Add user record version for the signed-in user cache
+
+Revision ID: a4d7e2b9c615
+Revises: f3b8d1a6c2e9
+Create Date: 2026-10-17 00:21:37.052218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d7e2b9c615'
+down_revision = 'f3b8d1a6c2e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('record_version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('record_version')
@@ -0,0 +1,39 @@
+"""Add indexes for hot query filters
+
+Revision ID: b7d41c9e2a10
+Revises: ee59767fca34
+Create Date: 2026-10-16 21:05:12.418233
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d41c9e2a10'
+down_revision = 'ee59767fca34'
+branch_labels = None
+depends_on = None
+
+
+# message_reactions(message_id, ...) and sheet_cells(sheet_id, ...) already
+# lead their unique constraints, so those lookups are indexed as-is.
+INDEXES = [
+    ('ix_messages_channel_id_id', 'messages', ['channel_id', 'id']),
+    ('ix_channel_members_user_id', 'channel_members', ['user_id', 'channel_id']),
+    ('ix_notifications_user_id_is_read_created_at', 'notifications', ['user_id', 'is_read', 'created_at']),
+    ('ix_notifications_message_id', 'notifications', ['message_id']),
+    ('ix_task_assignees_user_id', 'task_assignees', ['user_id', 'task_id']),
+    ('ix_attendance_user_id', 'attendance', ['user_id', 'event_id']),
+    ('ix_task_audit_logs_task_id_created_at', 'task_audit_logs', ['task_id', 'created_at']),
+]
+
+
+def upgrade():
+    # if_not_exists: create_all() may already have built them on a fresh database
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,74 @@
+"""Move embedded card JSON out of message content
+
+Revision ID: c3e8a5f17b42
+Revises: b7d41c9e2a10
+Create Date: 2026-10-16 22:14:37.902561
+
+"""
+import json
+import re
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8a5f17b42'
+down_revision = 'b7d41c9e2a10'
+branch_labels = None
+depends_on = None
+
+
+DATA_BLOB = re.compile(r'\s*<!-- DATA: (.*?) -->', re.S)
+MOM_PREVIEW_CHARS = 600  # keep in step with helpers.MOM_PREVIEW_CHARS
+BATCH = 500
+
+messages = sa.table('messages',
+    sa.column('id', sa.Integer),
+    sa.column('content', sa.Text),
+    sa.column('card', sa.JSON),
+)
+
+
+def _mom_preview(mom):
+    mom = (mom or '').strip()
+    return mom if len(mom) <= MOM_PREVIEW_CHARS else mom[:MOM_PREVIEW_CHARS].rstrip() + '…'
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('card', sa.JSON(), nullable=True))
+
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(messages.c.id, messages.c.content)
+            .where(messages.c.id > last_id, messages.c.content.like('%<!-- DATA: %'))
+            .order_by(messages.c.id).limit(BATCH)
+        ).all()
+        if not rows:
+            break
+        for msg_id, content in rows:
+            match = DATA_BLOB.search(content)
+            if not match:
+                continue
+            try:
+                card = json.loads(match.group(1))
+            except ValueError:
+                continue  # leave malformed blobs in place rather than lose them
+            if card.get('type') == 'mom' and 'mom_full' in card:
+                card['mom_preview'] = _mom_preview(card.pop('mom_full'))
+            conn.execute(messages.update().where(messages.c.id == msg_id).values(
+                content=DATA_BLOB.sub('', content).rstrip(), card=card))
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    conn = op.get_bind()
+    rows = conn.execute(sa.select(messages.c.id, messages.c.content, messages.c.card).where(messages.c.card.isnot(None))).all()
+    for msg_id, content, card in rows:
+        conn.execute(messages.update().where(messages.c.id == msg_id).values(
+            content=f'{content} <!-- DATA: {json.dumps(card)} -->'))
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_column('card')
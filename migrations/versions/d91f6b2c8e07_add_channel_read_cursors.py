@@ -0,0 +1,34 @@
+"""Add read cursors and unread counters to channel members
+
+Revision ID: d91f6b2c8e07
+Revises: c3e8a5f17b42
+Create Date: 2026-10-16 23:02:51.337190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91f6b2c8e07'
+down_revision = 'c3e8a5f17b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('channel_members', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_read_message_id', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('unread_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Start everyone caught up: cursor at the channel's newest message, nothing unread
+    op.execute("""
+        UPDATE channel_members SET last_read_message_id = COALESCE(
+            (SELECT MAX(messages.id) FROM messages WHERE messages.channel_id = channel_members.channel_id), 0)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('channel_members', schema=None) as batch_op:
+        batch_op.drop_column('unread_count')
+        batch_op.drop_column('last_read_message_id')
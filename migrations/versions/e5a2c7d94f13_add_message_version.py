@@ -0,0 +1,26 @@
+"""Add message version for the serialized-message cache
+
+Revision ID: e5a2c7d94f13
+Revises: d91f6b2c8e07
+Create Date: 2026-10-16 23:48:09.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a2c7d94f13'
+down_revision = 'd91f6b2c8e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_column('version')
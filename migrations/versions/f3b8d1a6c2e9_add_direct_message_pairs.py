@@ -0,0 +1,64 @@
+"""Add direct message pair index and backfill it from existing DM channels
+
+Revision ID: f3b8d1a6c2e9
+Revises: e5a2c7d94f13
+Create Date: 2026-10-16 23:59:12.418305
+
+"""
+import re
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d1a6c2e9'
+down_revision = 'e5a2c7d94f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    # The app's create_all may already have made the (empty) table
+    if not sa.inspect(bind).has_table('direct_message_pairs'):
+        op.create_table('direct_message_pairs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_low', sa.Integer(), nullable=False),
+            sa.Column('user_high', sa.Integer(), nullable=False),
+            sa.Column('channel_id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['channel_id'], ['channels.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['user_high'], ['users.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['user_low'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('channel_id'),
+            sa.UniqueConstraint('user_low', 'user_high')
+        )
+
+    # DM channels are named DM-<opener>-<target>; when racing clicks left
+    # several for one pair, the oldest becomes the pair's channel
+    rows = bind.execute(sa.text('SELECT user_low, user_high, channel_id FROM direct_message_pairs')).all()
+    existing, taken = {(low, high) for low, high, _ in rows}, {channel_id for _, _, channel_id in rows}
+    users = {uid for (uid,) in bind.execute(sa.text('SELECT id FROM users'))}
+    pairs = {}
+    for channel_id, name in bind.execute(sa.text("SELECT id, name FROM channels WHERE channel_type = 'dm' ORDER BY id")):
+        match = re.fullmatch(r'DM-(\d+)-(\d+)', name or '')
+        if not match:
+            continue
+        a, b = int(match.group(1)), int(match.group(2))
+        key = (min(a, b), max(a, b))
+        if a != b and a in users and b in users and key not in existing and channel_id not in taken:
+            pairs.setdefault(key, channel_id)
+
+    if pairs:
+        table = sa.table('direct_message_pairs',
+            sa.column('user_low', sa.Integer), sa.column('user_high', sa.Integer),
+            sa.column('channel_id', sa.Integer), sa.column('created_at', sa.DateTime))
+        now = datetime.utcnow()
+        op.bulk_insert(table, [{'user_low': low, 'user_high': high, 'channel_id': channel_id, 'created_at': now}
+                               for (low, high), channel_id in pairs.items()])
+
+
+def downgrade():
+    op.drop_table('direct_message_pairs')
@@ -19,7 +19,14 @@ class ChannelMember(db.Model):
     is_pinned = db.Column(db.Boolean, default=False)
     is_archived = db.Column(db.Boolean, default=False)
 
-    __table_args__ = (db.UniqueConstraint('channel_id', 'user_id'),)
+    # Read cursor: last message seen, and how many messages from others arrived after it
+    last_read_message_id = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    unread_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+
+    __table_args__ = (
+        db.UniqueConstraint('channel_id', 'user_id'),
+        db.Index('ix_channel_members_user_id', 'user_id', 'channel_id'),
+    )
 
     user = db.relationship('User', foreign_keys=[user_id], back_populates='channel_memberships')
     adder = db.relationship('User', foreign_keys=[added_by])
@@ -47,6 +54,9 @@ class User(db.Model):
     is_online = db.Column(db.Boolean, default=False)
     has_seen_tour = db.Column(db.Boolean, default=False)
 
+    # Bumped on every profile/role/password edit; sessions key the cached UserRecord by it (helpers.py)
+    record_version = db.Column(db.Integer, default=1, nullable=False, server_default='1')
+
     # Relationships
     messages = db.relationship('Message', backref='author', lazy=True)
     resources = db.relationship('Resource', backref='shared_by', lazy=True)
@@ -85,6 +95,20 @@ class Channel(db.Model):
     members = db.relationship('ChannelMember', backref='channel', lazy=True, cascade="all, delete-orphan")
 
 
+# ─── Direct messages ───
+class DirectMessagePair(db.Model):
+    """The DM channel between two users, keyed by the ordered pair so each pair has exactly one."""
+    __tablename__ = 'direct_message_pairs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_low = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)   # min(user ids)
+    user_high = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)  # max(user ids)
+    channel_id = db.Column(db.Integer, db.ForeignKey('channels.id', ondelete='CASCADE'), nullable=False, unique=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_low', 'user_high'),)
+
+
 class Message(db.Model):
     __tablename__ = 'messages'
 
@@ -97,6 +121,8 @@ class Message(db.Model):
     
     referenced_task_id = db.Column(db.Integer, db.ForeignKey('tasks.id', ondelete='SET NULL'), nullable=True)
     reply_to_id = db.Column(db.Integer, db.ForeignKey('messages.id', ondelete='SET NULL'), nullable=True)
+    card = db.Column(db.JSON, nullable=True)  # resource / event / meeting / mom card shown instead of the text
+    version = db.Column(db.Integer, default=1, nullable=False, server_default='1')  # bumped on react/vote; keys the serialized-message cache
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -104,6 +130,8 @@ class Message(db.Model):
     referenced_task = db.relationship('Task', foreign_keys=[referenced_task_id], backref='chat_references')
     replies = db.relationship('Message', backref=db.backref('parent', remote_side=[id]), lazy=True)
 
+    __table_args__ = (db.Index('ix_messages_channel_id_id', 'channel_id', 'id'),)
+
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
@@ -117,6 +145,56 @@ class Notification(db.Model):
     user = db.relationship('User', backref='notifications')
     message = db.relationship('Message', backref='notifications')
 
+    __table_args__ = (
+        db.Index('ix_notifications_user_id_is_read_created_at', 'user_id', 'is_read', 'created_at'),
+        db.Index('ix_notifications_message_id', 'message_id'),
+    )
+
+
+class BroadcastNotification(db.Model):
+    """A notification for every user but the sender, stored once; readers leave a BroadcastDismissal."""
+    __tablename__ = 'broadcast_notifications'
+
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('messages.id', ondelete='CASCADE'), nullable=False)
+    sender_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    message = db.relationship('Message')
+
+    __table_args__ = (
+        db.Index('ix_broadcast_notifications_created_at', 'created_at'),
+        db.Index('ix_broadcast_notifications_message_id', 'message_id'),
+    )
+
+
+class BroadcastDismissal(db.Model):
+    """One user has read (dismissed) a broadcast notification."""
+    __tablename__ = 'broadcast_dismissals'
+
+    id = db.Column(db.Integer, primary_key=True)
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcast_notifications.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('broadcast_id', 'user_id'),)
+
+
+class NotificationJob(db.Model):
+    """Queued @mention / DM fan-out for a message, processed by the worker pool in fanout.py."""
+    __tablename__ = 'notification_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('messages.id', ondelete='CASCADE'), nullable=False)
+    status = db.Column(db.String(20), default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, default='')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index('ix_notification_jobs_status', 'status'),)
+
 
 class Resource(db.Model):
     __tablename__ = 'resources'
@@ -195,7 +273,10 @@ class TaskAssignee(db.Model):
 
     user = db.relationship('User', backref='assigned_tasks')
     
-    __table_args__ = (db.UniqueConstraint('task_id', 'user_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('task_id', 'user_id'),
+        db.Index('ix_task_assignees_user_id', 'user_id', 'task_id'),
+    )
 
 
 class TaskAuditLog(db.Model):
@@ -211,6 +292,8 @@ class TaskAuditLog(db.Model):
     user = db.relationship('User', backref='task_logs')
     task = db.relationship('Task', backref='logs')
 
+    __table_args__ = (db.Index('ix_task_audit_logs_task_id_created_at', 'task_id', 'created_at'),)
+
 
 # ─── Polls ───
 class Poll(db.Model):
@@ -265,6 +348,81 @@ class MessageReaction(db.Model):
     __table_args__ = (db.UniqueConstraint('message_id', 'user_id', 'emoji'),)
 
 
+class MessageReactionCount(db.Model):
+    """Per-(message, emoji) totals maintained by api_react; rebuilt with `flask reconcile-reactions`."""
+    __tablename__ = 'message_reaction_counts'
+
+    message_id = db.Column(db.Integer, db.ForeignKey('messages.id', ondelete='CASCADE'), primary_key=True)
+    emoji = db.Column(db.String(10), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)  # first reaction, keeps display order stable
+
+
+# ─── Channel change feed ───
+class ChannelChange(db.Model):
+    """Append-only log of message changes; the autoincrement id is the sequence number clients sync from."""
+    __tablename__ = 'channel_changes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    channel_id = db.Column(db.Integer, db.ForeignKey('channels.id', ondelete='CASCADE'), nullable=False)
+    message_id = db.Column(db.Integer, nullable=False)  # no FK: 'deleted' entries outlive the message
+    kind = db.Column(db.String(20), nullable=False)  # created, deleted, reaction, poll_vote
+    payload = db.Column(db.Text, default='')  # JSON details, e.g. emoji/count for reactions
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_channel_changes_channel_id_id', 'channel_id', 'id'),)
+
+
+# ─── Message archive ───
+class MessageArchiveBlock(db.Model):
+    """One channel-month of archived messages (with reactions and polls) as zlib-compressed JSON; see archive.py."""
+    __tablename__ = 'message_archive_blocks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    channel_id = db.Column(db.Integer, db.ForeignKey('channels.id', ondelete='CASCADE'), nullable=False)
+    month = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    first_message_id = db.Column(db.Integer, nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=False)
+    message_count = db.Column(db.Integer, default=0)
+    payload = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('channel_id', 'month'),
+        db.Index('ix_message_archive_blocks_channel_id_last', 'channel_id', 'last_message_id'),
+    )
+
+
+# ─── Moderation ───
+class ModerationJob(db.Model):
+    """A bulk message purge run in batches by moderation.py; `last_message_id` is the resume cursor."""
+    __tablename__ = 'moderation_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)  # NULL once the requester is deleted
+    # Filters; any combination, at least one set
+    channel_id = db.Column(db.Integer, nullable=True)  # no FK: the job record outlives a removed channel
+    author_id = db.Column(db.Integer, nullable=True)
+    since = db.Column(db.DateTime, nullable=True)
+    until = db.Column(db.DateTime, nullable=True)
+
+    status = db.Column(db.String(20), default='pending')  # pending, running, done, failed, cancelled
+    batch_size = db.Column(db.Integer, default=500)
+    total = db.Column(db.Integer, default=0)  # matching messages when the job was queued
+    deleted_count = db.Column(db.Integer, default=0)
+    last_message_id = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, default='')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    requester = db.relationship('User', foreign_keys=[requested_by])
+
+    __table_args__ = (db.Index('ix_moderation_jobs_status', 'status'),)
+
+
 # ─── Sheets ───
 class Sheet(db.Model):
     __tablename__ = 'sheets'
@@ -327,7 +485,10 @@ class Attendance(db.Model):
     event = db.relationship('Event', backref='attendance_records')
     user = db.relationship('User', backref='attendance_records')
     
-    __table_args__ = (db.UniqueConstraint('event_id', 'user_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('event_id', 'user_id'),
+        db.Index('ix_attendance_user_id', 'user_id', 'event_id'),
+    )
 
 
 # ─── Inventory ───
@@ -0,0 +1,152 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func
+from models import db, Message, ModerationJob
+from services import MessageService
+from fanout import FanoutWorker
+import realtime
+
+
+def matching(job):
+    """Messages selected by a job's filters, oldest first."""
+    query = db.session.query(Message.id)
+    if job.channel_id:
+        query = query.filter(Message.channel_id == job.channel_id)
+    if job.author_id:
+        query = query.filter(Message.user_id == job.author_id)
+    if job.since:
+        query = query.filter(Message.created_at >= job.since)
+    if job.until:
+        query = query.filter(Message.created_at < job.until)
+    return query
+
+
+def describe(job):
+    """Progress report for the moderation API."""
+    if job.total:
+        progress = round(min(job.deleted_count / job.total, 1.0), 3)
+    else:
+        progress = 1.0 if job.status == 'done' else 0.0
+    return {
+        'id': job.id,
+        'status': job.status,
+        'filters': {
+            'channel_id': job.channel_id,
+            'author_id': job.author_id,
+            'since': job.since.isoformat() if job.since else None,
+            'until': job.until.isoformat() if job.until else None,
+        },
+        'total': job.total,
+        'deleted': job.deleted_count,
+        'progress': progress,
+        'error': job.error,
+        'requested_by': job.requested_by,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def queue_purge(requested_by, channel_id=None, author_id=None, since=None, until=None, batch_size=None):
+    """Record a purge job with its current match count and hand it to the pool."""
+    job = ModerationJob(
+        requested_by=requested_by, channel_id=channel_id, author_id=author_id, since=since, until=until,
+        batch_size=batch_size or current_app.config.get('MODERATION_BATCH_SIZE', 500),
+    )
+    job.total = matching(job).count()
+    db.session.add(job)
+    db.session.commit()
+    submit(job)
+    return job
+
+
+def run_batch(job):
+    """
+    Delete the next `batch_size` matching messages after the job's cursor
+    and advance it, in one transaction. Returns the number deleted.
+    """
+    ids = [msg_id for (msg_id,) in matching(job).filter(Message.id > job.last_message_id)
+           .order_by(Message.id).limit(job.batch_size)]
+    if not ids:
+        return 0
+    by_channel = MessageService.delete_messages(ids)
+    job.last_message_id = ids[-1]
+    job.deleted_count += sum(len(msg_ids) for msg_ids in by_channel.values())
+    job.heartbeat_at = datetime.utcnow()
+    db.session.commit()
+    # One event per channel is enough: clients catch up through the change feed
+    for channel_id, msg_ids in by_channel.items():
+        realtime.publish_deletion(channel_id, max(msg_ids))
+    return len(ids)
+
+
+def process_job(job_id):
+    """
+    Claim a pending job and run it to completion batch by batch. Each batch
+    commits its cursor, so a job interrupted by a crash resumes where it
+    stopped once the sweeper hands it back; cancelling takes effect between batches.
+    """
+    now = datetime.utcnow()
+    claimed = ModerationJob.query.filter_by(id=job_id, status='pending').update(
+        {'status': 'running', 'started_at': func.coalesce(ModerationJob.started_at, now), 'heartbeat_at': now},
+        synchronize_session=False)
+    db.session.commit()
+    if not claimed:
+        return
+
+    try:
+        while True:
+            job = db.session.get(ModerationJob, job_id, populate_existing=True)
+            if job.status != 'running':
+                return  # cancelled, or reclaimed by another worker after a stall
+            if not run_batch(job):
+                break
+        job.status = 'done'
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        print(f"✓ [MODERATION] Job {job_id} removed {job.deleted_count} messages")
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(ModerationJob, job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        db.session.commit()
+        print(f"✗ [MODERATION] Job {job_id} failed after {job.deleted_count} messages: {e}")
+
+
+def cancel(job):
+    """Stop a pending or running job after its current batch. Returns False if it already finished."""
+    if job.status not in ('pending', 'running'):
+        return False
+    job.status = 'cancelled'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+class ModerationWorker(FanoutWorker):
+    """Pool that runs moderation jobs; a job whose heartbeat stalls is resumed from its cursor."""
+    job_model = ModerationJob
+    stale_column = 'heartbeat_at'
+    name = 'moderation'
+
+    def process(self, job_id):
+        process_job(job_id)
+
+
+def init_moderation(app):
+    """MODERATION_WORKERS=0 runs purges inline in the request (tests, debugging)."""
+    workers = app.config.get('MODERATION_WORKERS', 1)
+    worker = app.extensions['moderation'] = ModerationWorker(app, max_workers=workers) if workers else None
+    if worker:
+        with app.app_context():
+            if ModerationJob.query.filter(ModerationJob.status.in_(('pending', 'running'))).first():
+                worker.start()
+
+
+def submit(job):
+    worker = current_app.extensions.get('moderation')
+    if worker:
+        worker.submit(job.id)
+    else:
+        process_job(job.id)
@@ -0,0 +1,195 @@
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+from cache import LRUCache
+
+
+class HasherBusy(Exception):
+    """Every hashing slot is taken; the caller should answer 503 and let the client retry."""
+
+
+class PasswordHasher:
+    """
+    Password hashing off the request threads. scrypt/PBKDF2 are CPU-bound by
+    design, so a burst of sign-ins (an event starting) would otherwise take
+    every core the worker has and stall chat polls. Hashes run in a small
+    process pool and at most `max_pending` may be running or queued at
+    once; past that, calls fail fast with HasherBusy instead of piling up.
+    One pool per worker process. workers=0 hashes in the calling thread,
+    still bounded by `max_pending`.
+    """
+
+    def __init__(self, workers=1, max_pending=16, method='scrypt:32768:8:1'):
+        self.workers = workers
+        self.method = method
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def needs_rehash(self, pwhash):
+        """True when a stored hash was made with another method or cost than the current one."""
+        return pwhash.split('$', 1)[0] != self.method
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            if not self.workers:
+                return fn(*args)
+            try:
+                return self._pool().submit(fn, *args).result()
+            except BrokenProcessPool as e:
+                # A hashing process died (OOM kill, ...); start a fresh pool for the next call
+                with self._lock:
+                    self._executor = None
+                raise HasherBusy() from e
+        finally:
+            self._slots.release()
+
+    def _pool(self):
+        # Spawned, not forked: the worker process already runs presence/fan-out threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+class LoginThrottle:
+    """
+    Failed sign-ins per account and per client IP. A key that reaches its
+    limit is refused until `window` seconds pass without another failure
+    (every failure restarts the window). Per worker process, like the caches.
+    """
+
+    def __init__(self, per_account=5, per_ip=20, window=300):
+        self.limits = {'account': per_account, 'ip': per_ip}
+        self.failures = LRUCache(maxsize=10000, ttl=window)
+
+    def _keys(self, email, ip):
+        return [('account', email), ('ip', ip)]
+
+    def blocked(self, email, ip):
+        counts = self.failures.get_many(self._keys(email, ip))
+        return any(count >= self.limits[kind] for (kind, _), count in counts.items())
+
+    def failed(self, email, ip):
+        keys = self._keys(email, ip)
+        counts = self.failures.get_many(keys)
+        self.failures.put_many({key: counts.get(key, 0) + 1 for key in keys})
+
+    def succeeded(self, email):
+        self.failures.evict(lambda key: key == ('account', email))
+
+
+def init_passwords(app):
+    """PASSWORD_WORKERS=0 hashes inline in the request (tests, debugging)."""
+    app.extensions['passwords'] = PasswordHasher(
+        workers=app.config.get('PASSWORD_WORKERS', 1),
+        max_pending=app.config.get('PASSWORD_QUEUE_LIMIT', 16),
+        method=app.config.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'),
+    )
+    app.extensions['login_throttle'] = LoginThrottle(
+        per_account=app.config.get('LOGIN_MAX_FAILURES_PER_ACCOUNT', 5),
+        per_ip=app.config.get('LOGIN_MAX_FAILURES_PER_IP', 20),
+        window=app.config.get('LOGIN_THROTTLE_WINDOW', 300),
+    )
+
+
+def get_hasher():
+    return current_app.extensions['passwords']
+
+
+def get_throttle():
+    return current_app.extensions['login_throttle']
+
+
+# ─── Benchmark (flask bench-login) ───
+def _latency(samples):
+    if len(samples) < 2:
+        return {'polls': len(samples), 'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+    q = statistics.quantiles(samples, n=20)
+    return {'polls': len(samples), 'p50_ms': q[9] * 1000, 'p95_ms': q[18] * 1000, 'max_ms': max(samples) * 1000}
+
+
+def benchmark(accounts, password, poll_user_id, concurrency=16, baseline_seconds=2.0):
+    """
+    Sign every (email) in `accounts` in through POST /login, `concurrency`
+    at a time, while another thread polls /api/sync as `poll_user_id`; once
+    with hashing inline and once through the configured pool. Returns rows of
+    {'mode', 'ok', 'busy', 'seconds', 'per_second', 'per_core', 'polls',
+    'p50_ms', 'p95_ms', 'max_ms'}; the first row ('idle') is poll latency
+    with no sign-ins running.
+    """
+    app = current_app._get_current_object()
+    config = app.config
+    poller = app.test_client()
+    with poller.session_transaction() as session:
+        session['user_id'] = poll_user_id
+
+    def poll(stop, samples):
+        while not stop.is_set():
+            start = time.perf_counter()
+            poller.get('/api/sync?channels=&notifications=')
+            samples.append(time.perf_counter() - start)
+
+    def sign_in(email):
+        return app.test_client().post('/login', data={'email': email, 'password': password}).status_code
+
+    def measure(run):
+        stop, samples = threading.Event(), []
+        thread = threading.Thread(target=poll, args=(stop, samples), daemon=True)
+        thread.start()
+        try:
+            return run(), samples
+        finally:
+            stop.set()
+            thread.join()
+
+    _, samples = measure(lambda: time.sleep(baseline_seconds))
+    rows = [{'mode': 'idle', 'ok': 0, 'busy': 0, 'seconds': baseline_seconds, 'per_second': 0.0, 'per_core': 0.0, **_latency(samples)}]
+
+    workers = max(config.get('PASSWORD_WORKERS', 1), 1)
+    saved = app.extensions['passwords'], app.extensions['login_throttle']
+    try:
+        for mode, hashing_workers in (('inline', 0), ('pool', workers)):
+            hasher = app.extensions['passwords'] = PasswordHasher(
+                workers=hashing_workers, max_pending=config.get('PASSWORD_QUEUE_LIMIT', 16),
+                method=config.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1'))
+            app.extensions['login_throttle'] = LoginThrottle(per_account=len(accounts), per_ip=len(accounts))
+            hasher.verify(hasher.hash(password), password)  # start the pool's processes outside the timing
+
+            def storm():
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    statuses = list(pool.map(sign_in, accounts))
+                return statuses, time.perf_counter() - start
+
+            (statuses, seconds), samples = measure(storm)
+            hasher.shutdown()
+            ok = statuses.count(302)
+            # Inline hashing can use every core the threads land on; the pool uses its own processes
+            cores = hashing_workers or min(concurrency, os.cpu_count() or 1)
+            rows.append({'mode': mode, 'ok': ok, 'busy': statuses.count(503), 'seconds': seconds,
+                         'per_second': ok / seconds, 'per_core': ok / seconds / cores, **_latency(samples)})
+    finally:
+        app.extensions['passwords'], app.extensions['login_throttle'] = saved
+    return rows
@@ -0,0 +1,132 @@
+import atexit
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app, session
+from sqlalchemy import bindparam, update
+from models import db, User
+from services import ChannelListService
+import realtime
+
+
+class PresenceTracker:
+    """
+    Heartbeats of signed-in users, kept in memory and written behind.
+    Every authenticated request (and every open stream, on its keepalive)
+    calls beat(); flush() persists the batch with one executemany UPDATE
+    and flips is_online for users whose last beat is older than `ttl`.
+    One tracker per worker process; the database is the shared view.
+    """
+
+    # Ids per IN (...) clause when flushing
+    CHUNK = 500
+
+    def __init__(self, app, ttl=90, flush_interval=15):
+        self.app = app
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self._seen = {}     # user_id -> last beat (utc), recent ones only
+        self._dirty = {}    # beats not yet written
+        self._left = set()  # logged out since the last flush
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def beat(self, user_id):
+        now = datetime.utcnow()
+        with self._lock:
+            self._seen[user_id] = self._dirty[user_id] = now
+            self._left.discard(user_id)
+        if self.flush_interval:
+            self._ensure_flusher()
+        else:
+            # Own app context, so its own session: never commit the caller's
+            # half-built request, and works from a stream with no context at all
+            self._flush_in_context()
+
+    def leave(self, user_id):
+        """Mark a user offline at the next flush (logout), unless they beat again first."""
+        with self._lock:
+            self._seen.pop(user_id, None)
+            self._dirty.pop(user_id, None)
+            self._left.add(user_id)
+
+    def is_online(self, user_id):
+        seen = self._seen.get(user_id)
+        return seen is not None and datetime.utcnow() - seen < timedelta(seconds=self.ttl)
+
+    def flush(self):
+        """Write pending beats and online/offline transitions, then announce the transitions."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            left, self._left = self._left, set()
+            cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+            for uid in [uid for uid, seen in self._seen.items() if seen < cutoff]:
+                del self._seen[uid]
+            live = set(self._seen)
+
+        came_online = []
+        if dirty:
+            ids = list(dirty)
+            for i in range(0, len(ids), self.CHUNK):
+                came_online += [uid for (uid,) in db.session.query(User.id).filter(
+                    User.id.in_(ids[i:i + self.CHUNK]), User.is_online == False)]
+            users = User.__table__
+            db.session.execute(
+                update(users).where(users.c.id == bindparam('user_id')).values(last_seen=bindparam('seen'), is_online=True),
+                [{'user_id': uid, 'seen': seen} for uid, seen in dirty.items()])
+
+        # Stale across all workers: nobody has flushed a beat for them within the ttl
+        stale = {uid for (uid,) in db.session.query(User.id).filter(User.is_online == True, User.last_seen < cutoff)}
+        went_offline = list((stale | left) - live)
+        for i in range(0, len(went_offline), self.CHUNK):
+            User.query.filter(User.id.in_(went_offline[i:i + self.CHUNK])).update({'is_online': False}, synchronize_session=False)
+        db.session.commit()
+
+        if came_online or went_offline:
+            ChannelListService.invalidate_peers(came_online + went_offline)
+            realtime.publish(realtime.BROADCAST_TOPIC, {'type': 'presence', 'online': came_online, 'offline': went_offline})
+        return len(dirty)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_forever, name='presence-flusher', daemon=True)
+                self._flusher.start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self._flush_in_context()
+
+    def _flush_in_context(self):
+        try:
+            with self.app.app_context():
+                try:
+                    self.flush()
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            print(f"✗ [PRESENCE] Flush failed: {e}")
+
+
+def _beat():
+    user_id = session.get('user_id')
+    if user_id:
+        current_app.extensions['presence'].beat(user_id)
+
+
+def init_presence(app):
+    """PRESENCE_FLUSH_INTERVAL=0 writes every beat immediately (tests, debugging)."""
+    tracker = app.extensions['presence'] = PresenceTracker(
+        app,
+        ttl=app.config.get('PRESENCE_TTL', 90),
+        flush_interval=app.config.get('PRESENCE_FLUSH_INTERVAL', 15),
+    )
+    app.before_request(_beat)
+    atexit.register(tracker._flush_in_context)  # don't lose the last interval on a clean shutdown
+
+
+def get_tracker():
+    return current_app.extensions['presence']
@@ -0,0 +1,59 @@
+import re
+from sqlalchemy import select, text
+from models import db, Message, ChannelMember, Notification, MessageReaction, MessageReactionCount, TaskAssignee, Attendance, SheetCell, TaskAuditLog, ChannelChange, BroadcastNotification, BroadcastDismissal
+
+
+# The filters behind the busiest API endpoints, with representative ids.
+# Each must be answerable from an index; see `flask check-query-plans`.
+KEY_QUERIES = [
+    ('messages page', lambda: select(Message).where(Message.channel_id == 1).order_by(Message.id.desc()).limit(100)),
+    ('messages before', lambda: select(Message).where(Message.channel_id == 1, Message.id < 1000).order_by(Message.id.desc()).limit(100)),
+    ('channel memberships', lambda: select(ChannelMember.channel_id).where(ChannelMember.user_id == 1)),
+    ('unread notifications', lambda: select(Notification).where(Notification.user_id == 1, Notification.is_read == False).order_by(Notification.created_at.desc())),
+    ('notifications for message', lambda: select(Notification.user_id).where(Notification.message_id == 1)),
+    ('broadcast notifications since', lambda: select(BroadcastNotification.id).where(BroadcastNotification.created_at >= '2026-01-01')),
+    ('broadcast dismissal', lambda: select(BroadcastDismissal.id).where(BroadcastDismissal.broadcast_id == 1, BroadcastDismissal.user_id == 1)),
+    ('viewer reactions', lambda: select(MessageReaction.message_id, MessageReaction.emoji).where(MessageReaction.message_id.in_([1, 2, 3]), MessageReaction.user_id == 1)),
+    ('reaction counts', lambda: select(MessageReactionCount).where(MessageReactionCount.message_id.in_([1, 2, 3]))),
+    ('tasks for user', lambda: select(TaskAssignee.task_id).where(TaskAssignee.user_id == 1)),
+    ('attendance for user', lambda: select(Attendance).where(Attendance.user_id == 1)),
+    ('sheet cells', lambda: select(SheetCell).where(SheetCell.sheet_id == 1)),
+    ('task audit log', lambda: select(TaskAuditLog).where(TaskAuditLog.task_id == 1).order_by(TaskAuditLog.created_at)),
+    ('channel change feed', lambda: select(ChannelChange).where(ChannelChange.channel_id == 1, ChannelChange.id > 0).order_by(ChannelChange.id).limit(500)),
+]
+
+# SQLite: "SCAN messages" (optionally "USING ... INDEX") walks the whole table or index
+_SQLITE_FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)(\w+)')
+_POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def _explain(conn, sql, dialect):
+    if dialect == 'postgresql':
+        # With seq scans priced out, one still showing up means no usable index exists
+        conn.execute(text('SET LOCAL enable_seqscan = off'))
+        rows = conn.execute(text('EXPLAIN ANALYZE ' + sql)).all()
+        lines = [r[0] for r in rows]
+        return lines, [m.group(1) for l in lines for m in [_POSTGRES_FULL_SCAN.search(l)] if m]
+    rows = conn.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+    lines = [r[-1] for r in rows]
+    return lines, [m.group(1) for l in lines for m in [_SQLITE_FULL_SCAN.match(l)] if m]
+
+
+def check_query_plans():
+    """
+    EXPLAIN every key query and report the tables it scans in full.
+    Returns a list of {'name', 'sql', 'plan', 'full_scans'}; an empty
+    `full_scans` means the query is served by an index.
+    """
+    dialect = db.engine.dialect.name
+    report = []
+    with db.engine.connect() as conn:
+        for name, build in KEY_QUERIES:
+            sql = str(build().compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+            trans = conn.begin()
+            try:
+                plan, scans = _explain(conn, sql, dialect)
+            finally:
+                trans.rollback()
+            report.append({'name': name, 'sql': sql, 'plan': plan, 'full_scans': scans})
+    return report
@@ -0,0 +1,172 @@
+import json
+import queue
+import threading
+from flask import current_app
+
+
+# Topic names
+def channel_topic(channel_id):
+    return f'channel:{channel_id}'
+
+
+def user_topic(user_id):
+    return f'user:{user_id}'
+
+
+BROADCAST_TOPIC = 'broadcast'
+
+
+class Subscription:
+    """A subscriber's view of a set of topics. `get` returns the next event or None on timeout."""
+
+    def get(self, timeout=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class LocalBroker:
+    """
+    In-process publish/subscribe broker.
+    Only sees events published by the same worker, so it is meant for
+    single-process deployments, development and tests.
+    """
+
+    class _Subscription(Subscription):
+        def __init__(self, broker, topics, maxsize):
+            self.broker = broker
+            self.topics = set(topics)
+            self.queue = queue.Queue(maxsize=maxsize)
+            self.lagged = False
+
+        def push(self, event):
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                # Slow consumer: drop it so the client reconnects and resyncs
+                self.lagged = True
+
+        def get(self, timeout=None):
+            if self.lagged:
+                raise ConnectionError('Subscriber fell behind')
+            try:
+                return self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+
+        def close(self):
+            self.broker._unsubscribe(self)
+
+    def __init__(self, maxsize=500):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._subscribers = {}  # topic -> set of subscriptions
+
+    def subscribe(self, topics):
+        sub = self._Subscription(self, topics, self.maxsize)
+        with self._lock:
+            for t in sub.topics:
+                self._subscribers.setdefault(t, set()).add(sub)
+        return sub
+
+    def _unsubscribe(self, sub):
+        with self._lock:
+            for t in sub.topics:
+                subs = self._subscribers.get(t)
+                if subs:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subscribers[t]
+
+    def publish(self, topic, event):
+        with self._lock:
+            subs = list(self._subscribers.get(topic, ()))
+        for sub in subs:
+            sub.push(event)
+
+
+class RedisBroker:
+    """Broker backed by Redis pub/sub, shared by every gunicorn worker."""
+
+    class _Subscription(Subscription):
+        def __init__(self, client, topics):
+            self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+            self.pubsub.subscribe(*topics)
+
+        def get(self, timeout=None):
+            msg = self.pubsub.get_message(timeout=timeout)
+            if msg is None:
+                return None
+            return json.loads(msg['data'])
+
+        def close(self):
+            self.pubsub.close()
+
+    def __init__(self, url):
+        import redis  # optional dependency, only needed for multi-worker deployments
+        self.client = redis.Redis.from_url(url)
+
+    def subscribe(self, topics):
+        return self._Subscription(self.client, topics)
+
+    def publish(self, topic, event):
+        self.client.publish(topic, json.dumps(event))
+
+
+def init_broker(app):
+    """Pick the broker backend from STREAM_BROKER_URL (redis://...), defaulting to the in-process one."""
+    url = app.config.get('STREAM_BROKER_URL')
+    app.extensions['broker'] = RedisBroker(url) if url else LocalBroker()
+    app.extensions['stream_slots'] = threading.BoundedSemaphore(app.config.get('STREAM_MAX_CONNECTIONS', 4))
+
+
+def get_broker():
+    return current_app.extensions['broker']
+
+
+def stream_slots():
+    """This worker's open-stream allowance: acquire without blocking, release when the stream closes."""
+    return current_app.extensions['stream_slots']
+
+
+def publish(topic, event):
+    """Publish an event; a broker outage must never fail the write that triggered it."""
+    try:
+        get_broker().publish(topic, event)
+    except Exception as e:
+        print(f"✗ [STREAM] Publish to {topic} failed: {e}")
+
+
+# ─── Event helpers (call after the triggering commit) ───
+def publish_message(msg):
+    publish(channel_topic(msg.channel_id), {'type': 'message', 'channel_id': msg.channel_id, 'id': msg.id})
+
+
+def publish_reaction(channel_id, message_id, emoji, user_id, action, count):
+    publish(channel_topic(channel_id), {
+        'type': 'reaction', 'channel_id': channel_id, 'message_id': message_id,
+        'emoji': emoji, 'user_id': user_id, 'action': action, 'count': count
+    })
+
+
+def publish_deletion(channel_id, message_id):
+    publish(channel_topic(channel_id), {'type': 'delete', 'channel_id': channel_id, 'message_id': message_id})
+
+
+def publish_poll(channel_id, message_id):
+    publish(channel_topic(channel_id), {'type': 'poll', 'channel_id': channel_id, 'message_id': message_id})
+
+
+def publish_notifications(user_ids, message_id):
+    for uid in user_ids:
+        publish(user_topic(uid), {'type': 'notification', 'message_id': message_id})
+
+
+def publish_broadcast_notification(message_id, exclude_user_id=None):
+    publish(BROADCAST_TOPIC, {'type': 'notification', 'message_id': message_id, 'exclude_user_id': exclude_user_id})
+
+
+def publish_channels_changed(user_ids):
+    for uid in user_ids:
+        publish(user_topic(uid), {'type': 'channels'})
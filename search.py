@@ -0,0 +1,178 @@
+import html
+import re
+from datetime import datetime
+from sqlalchemy import text, bindparam
+from sqlalchemy.exc import OperationalError
+from flask import current_app
+from models import db, Message
+
+
+# Snippet highlight markers; swapped for <mark> after HTML-escaping the snippet
+MARK_START, MARK_END = '\x02', '\x03'
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS message_search "
+    "USING fts5(content, channel_id UNINDEXED, tokenize='porter unicode61')",
+]
+POSTGRES_DDL = [
+    "CREATE TABLE IF NOT EXISTS message_search ("
+    " message_id INTEGER PRIMARY KEY,"
+    " channel_id INTEGER NOT NULL,"
+    " tsv tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_message_search_tsv ON message_search USING GIN (tsv)",
+    "CREATE INDEX IF NOT EXISTS ix_message_search_channel_id ON message_search (channel_id)",
+]
+
+
+def init_search(app):
+    """
+    Create the search table next to create_all(): an FTS5 virtual table on
+    SQLite, a tsvector table with a GIN index on PostgreSQL. If the SQLite
+    build has no FTS5, search is switched off instead of failing startup.
+    """
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        try:
+            with db.engine.begin() as conn:
+                for stmt in (POSTGRES_DDL if dialect == 'postgresql' else SQLITE_DDL):
+                    conn.execute(text(stmt))
+            app.extensions['search'] = dialect
+        except OperationalError as e:
+            app.extensions['search'] = None
+            print(f"✗ [SEARCH] Full-text search disabled: {e}")
+
+
+def enabled():
+    return current_app.extensions.get('search') is not None
+
+
+def _is_postgres():
+    return current_app.extensions.get('search') == 'postgresql'
+
+
+# ─── Incremental updates (run inside the caller's transaction) ───
+def _upsert_stmt():
+    if _is_postgres():
+        return text(
+            "INSERT INTO message_search (message_id, channel_id, tsv) "
+            "VALUES (:id, :channel_id, to_tsvector('english', :content)) "
+            "ON CONFLICT (message_id) DO UPDATE SET channel_id = EXCLUDED.channel_id, tsv = EXCLUDED.tsv")
+    return text("INSERT OR REPLACE INTO message_search (rowid, content, channel_id) VALUES (:id, :content, :channel_id)")
+
+
+def index_message(msg):
+    """Add or refresh one message. Call after the message has been flushed (needs msg.id)."""
+    if not enabled():
+        return
+    db.session.execute(_upsert_stmt(), {'id': msg.id, 'channel_id': msg.channel_id, 'content': msg.content})
+
+
+def unindex_messages(message_ids):
+    """
+    Drop messages from the index. Search joins back to `messages`, so an entry
+    missed here (e.g. a cascade from deleting a user) never shows up in results.
+    """
+    if not enabled() or not message_ids:
+        return
+    key = 'message_id' if _is_postgres() else 'rowid'
+    stmt = text(f"DELETE FROM message_search WHERE {key} IN :ids").bindparams(bindparam('ids', expanding=True))
+    db.session.execute(stmt, {'ids': list(message_ids)})
+
+
+# ─── Querying ───
+def _fts5_query(q):
+    """Quote each word (so FTS5 operators in user input are inert) and prefix-match the last one."""
+    words = re.findall(r'\w+', q)
+    if not words:
+        return None
+    return ' '.join(f'"{w}"' for w in words[:-1]) + (' ' if len(words) > 1 else '') + f'"{words[-1]}"*'
+
+
+SQLITE_SEARCH = """
+    SELECT m.id, m.channel_id, c.name, c.channel_type, u.name, m.created_at,
+           snippet(message_search, 0, :mark_start, :mark_end, '…', 16) AS snip
+    FROM message_search
+    JOIN channel_members cm ON cm.channel_id = message_search.channel_id AND cm.user_id = :user_id
+    JOIN messages m ON m.id = message_search.rowid
+    JOIN users u ON u.id = m.user_id
+    JOIN channels c ON c.id = m.channel_id
+    WHERE message_search MATCH :query {channel_filter}
+    ORDER BY bm25(message_search), m.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+POSTGRES_SEARCH = """
+    SELECT m.id, m.channel_id, c.name, c.channel_type, u.name, m.created_at,
+           ts_headline('english', m.content, q.tsq, :headline) AS snip
+    FROM message_search s
+    CROSS JOIN (SELECT websearch_to_tsquery('english', :query) AS tsq) q
+    JOIN channel_members cm ON cm.channel_id = s.channel_id AND cm.user_id = :user_id
+    JOIN messages m ON m.id = s.message_id
+    JOIN users u ON u.id = m.user_id
+    JOIN channels c ON c.id = m.channel_id
+    WHERE s.tsv @@ q.tsq {channel_filter}
+    ORDER BY ts_rank(s.tsv, q.tsq) DESC, m.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def search(user, q, channel_id=None, limit=20, offset=0):
+    """
+    Ranked hits for `q` in channels `user` belongs to, each with an HTML-safe
+    snippet where matches are wrapped in <mark>.
+    """
+    params = {'user_id': user.id, 'limit': limit, 'offset': offset,
+              'mark_start': MARK_START, 'mark_end': MARK_END,
+              'headline': f'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=24, MinWords=8, MaxFragments=1'}
+    if _is_postgres():
+        sql, params['query'] = POSTGRES_SEARCH, q
+        channel_filter = 'AND s.channel_id = :channel_id'
+    else:
+        sql, params['query'] = SQLITE_SEARCH, _fts5_query(q)
+        channel_filter = 'AND message_search.channel_id = :channel_id'
+        if params['query'] is None:
+            return []
+    if channel_id:
+        params['channel_id'] = channel_id
+    rows = db.session.execute(text(sql.format(channel_filter=channel_filter if channel_id else '')), params).all()
+
+    results = []
+    for msg_id, ch_id, ch_name, ch_type, author, created_at, snip in rows:
+        if isinstance(created_at, str):  # SQLite hands back text for raw SQL
+            created_at = datetime.fromisoformat(created_at)
+        results.append({
+            'message_id': msg_id,
+            'channel_id': ch_id,
+            'channel_name': ch_name,
+            'channel_type': ch_type,
+            'author_name': author,
+            'created_at': created_at.strftime('%b %d, %I:%M %p') if created_at else '',
+            'snippet': html.escape(snip or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'),
+        })
+    return results
+
+
+# ─── Backfill ───
+def backfill(chunk_size=1000, rebuild=False, progress=None):
+    """
+    Index existing messages in id order, one short transaction per chunk so
+    writers to `messages` are never blocked for long. Safe to re-run: rows are
+    upserted. Returns the number of messages indexed.
+    """
+    if rebuild:
+        db.session.execute(text('DELETE FROM message_search'))
+        db.session.commit()
+
+    last_id, total = 0, 0
+    stmt = _upsert_stmt()
+    while True:
+        rows = (db.session.query(Message.id, Message.channel_id, Message.content)
+                .filter(Message.id > last_id).order_by(Message.id).limit(chunk_size).all())
+        if not rows:
+            break
+        db.session.execute(stmt, [{'id': i, 'channel_id': c, 'content': t} for i, c, t in rows])
+        db.session.commit()
+        last_id, total = rows[-1][0], total + len(rows)
+        if progress:
+            progress(total, last_id)
+    return total
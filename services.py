@@ -1,6 +1,34 @@
-from models import db, User, Task, TaskAuditLog, TaskAssignee, Event, Attendance
+from models import db, User, Task, TaskAuditLog, TaskAssignee, Event, Attendance, Message, MessageReaction, Poll, PollOption, PollVote, ChannelChange, MessageReactionCount, ChannelMember, Channel, Notification, NotificationJob, DirectMessagePair, BroadcastNotification, BroadcastDismissal
 from datetime import datetime, timedelta, date
-from sqlalchemy import func, desc
+import json
+from sqlalchemy import func, desc, select, insert, case, and_, or_, literal, union_all, Integer, DateTime, event
+from sqlalchemy.orm import aliased, Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import search as search_index
+from cache import message_cache, channel_list_cache, membership_cache
+
+
+def after_commit(callback, *args):
+    """
+    Run `callback(*args)` once the current transaction commits; dropped if it
+    rolls back. For cache evictions: evicting before the commit lets another
+    thread re-cache the old rows in between.
+    """
+    db.session.info.setdefault('after_commit', []).append((callback, args))
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_after_commit(session):
+    for callback, args in session.info.pop('after_commit', []):
+        callback(*args)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _drop_after_commit(session, transaction):
+    if transaction.parent is None:  # outermost transaction rolled back or closed without committing
+        session.info.pop('after_commit', None)
 
 class AnalyticsService:
     @staticmethod
@@ -129,3 +157,618 @@ class AnalyticsService:
             'events_attended': present,
             'total_events': total_events
         }
+
+
+class MessageService:
+    @staticmethod
+    def serialize_page(messages, viewer):
+        """
+        Serialize a page of messages for the chat API.
+        The viewer-independent part of each message comes from the shared
+        cache keyed by (id, version); only misses are built, with one
+        set-based query per related table. The viewer's own bits (is_own,
+        user_reacted, user_voted) are overlaid afterwards.
+        """
+        if not messages:
+            return []
+
+        cache = message_cache()
+        shared = {key[0]: value for key, value in cache.get_many([(m.id, m.version) for m in messages]).items()}
+        missing = [m for m in messages if m.id not in shared]
+        if missing:
+            built = MessageService.build_shared(missing)
+            cache.put_many({(m.id, m.version): built[m.id] for m in missing})
+            shared.update(built)
+
+        # The viewer's own reactions: one indexed lookup, only if anything on the page has reactions
+        own = {}
+        reacted_ids = [m.id for m in messages if shared[m.id]['reactions']]
+        if reacted_ids:
+            for message_id, emoji in db.session.query(MessageReaction.message_id, MessageReaction.emoji).filter(
+                    MessageReaction.message_id.in_(reacted_ids), MessageReaction.user_id == viewer.id):
+                own.setdefault(message_id, set()).add(emoji)
+
+        return [MessageService.with_viewer(shared[m.id], own.get(m.id, ()), viewer) for m in messages]
+
+    @staticmethod
+    def build_shared(messages):
+        """
+        Viewer-independent payloads for `messages`, as {message_id: payload}.
+        Authors, reactions, polls (options, votes, voters) and referenced
+        tasks are loaded with one set-based query each.
+        """
+        msg_ids = [m.id for m in messages]
+
+        # Authors
+        author_ids = {m.user_id for m in messages}
+        authors = {u.id: u for u in User.query.filter(User.id.in_(author_ids)).all()}
+
+        # Referenced tasks
+        task_ids = {m.referenced_task_id for m in messages if m.referenced_task_id}
+        tasks = {t.id: t for t in Task.query.filter(Task.id.in_(task_ids)).all()} if task_ids else {}
+
+        # Reaction totals from the counter table
+        reactions_by_msg = {}
+        counts = MessageReactionCount.query.filter(MessageReactionCount.message_id.in_(msg_ids)).order_by(
+            MessageReactionCount.created_at, MessageReactionCount.emoji).all()
+        for rc in counts:
+            reactions_by_msg.setdefault(rc.message_id, {})[rc.emoji] = {'count': rc.count}
+
+        # Polls -> options -> votes (with voter names)
+        polls = {p.message_id: p for p in Poll.query.filter(Poll.message_id.in_(msg_ids)).all()}
+        options_by_poll = {}
+        votes_by_option = {}
+        if polls:
+            poll_ids = [p.id for p in polls.values()]
+            options = PollOption.query.filter(PollOption.poll_id.in_(poll_ids)).order_by(PollOption.poll_id, PollOption.sort_order, PollOption.id).all()
+            for opt in options:
+                options_by_poll.setdefault(opt.poll_id, []).append(opt)
+            if options:
+                votes = db.session.query(PollVote.option_id, User.id, User.name).join(
+                    User, User.id == PollVote.user_id
+                ).filter(PollVote.option_id.in_([o.id for o in options])).order_by(PollVote.id).all()
+                for option_id, voter_id, voter_name in votes:
+                    votes_by_option.setdefault(option_id, []).append({'id': voter_id, 'name': voter_name})
+
+        result = {}
+        for msg in messages:
+            poll_data = None
+            poll = polls.get(msg.id)
+            if poll:
+                options = [(opt.id, opt.text) for opt in options_by_poll.get(poll.id, [])]
+                poll_data = MessageService.poll_payload(poll.id, poll.question, poll.is_active, options, votes_by_option)
+
+            result[msg.id] = MessageService.message_payload(
+                msg.id, msg.user_id, msg.content, msg.card, msg.message_type, msg.created_at,
+                authors.get(msg.user_id), tasks.get(msg.referenced_task_id),
+                reactions_by_msg.get(msg.id, {}), poll_data)
+        return result
+
+    @staticmethod
+    def poll_payload(poll_id, question, is_active, options, votes_by_option):
+        """Poll block of a message. `options` is [(id, text)], `votes_by_option` maps option id -> [{'id', 'name'}]."""
+        total_votes = sum(len(votes_by_option.get(opt_id, [])) for opt_id, _ in options)
+        return {
+            'id': poll_id,
+            'question': question,
+            'is_active': is_active,
+            'options': [{
+                'id': opt_id,
+                'text': text,
+                'votes': len(votes_by_option.get(opt_id, [])),
+                'pct': round(len(votes_by_option.get(opt_id, [])) / total_votes * 100) if total_votes else 0,
+                'voters': votes_by_option.get(opt_id, [])
+            } for opt_id, text in options],
+            'total_votes': total_votes
+        }
+
+    @staticmethod
+    def message_payload(msg_id, user_id, content, card, message_type, created_at, author, task, reactions, poll_data):
+        """The viewer-independent JSON of one chat message, shared by live and archived messages."""
+        return {
+            'id': msg_id,
+            'user_id': user_id,
+            'content': content,
+            'card': card,
+            'message_type': message_type,
+            'author_name': author.name if author else 'Unknown',
+            'author_role': author.role if author else '',
+            'author_avatar_color': author.avatar_color if author else '#6C63FF',
+            'created_at': created_at.strftime('%I:%M %p'),
+            'referenced_task': {'title': task.title, 'status': task.status, 'due_date': task.due_date.strftime('%b %d') if task.due_date else None} if task else None,
+            'reactions': reactions,
+            'poll': poll_data
+        }
+
+    @staticmethod
+    def with_viewer(shared, own_emojis, viewer):
+        """
+        Overlay the viewer's bits on a shared payload without mutating it
+        (cached payloads are shared between requests and threads).
+        """
+        out = dict(shared)
+        out['is_own'] = shared['user_id'] == viewer.id
+        out['reactions'] = {emoji: {'count': r['count'], 'user_reacted': emoji in own_emojis}
+                            for emoji, r in shared['reactions'].items()}
+        if shared['poll']:
+            poll = shared['poll']
+            out['poll'] = dict(poll, options=[dict(o, user_voted=any(v['id'] == viewer.id for v in o['voters']))
+                                              for o in poll['options']])
+        return out
+
+    @staticmethod
+    def record_created(msg):
+        """
+        Bookkeeping for a new chat message: change feed, search index and
+        unread counters. Call after flushing the message, before the commit.
+        """
+        ChangeFeed.record(msg.channel_id, 'created', msg.id)
+        search_index.index_message(msg)
+        UnreadService.bump(msg)
+
+    # Ids per IN (...) clause in set-based deletes
+    DELETE_CHUNK = 500
+
+    @staticmethod
+    def purge(ids):
+        """
+        Delete messages and everything hanging off them (polls and votes,
+        reactions and counters, notifications, fan-out jobs, search rows) with
+        a fixed number of set-based statements per chunk. No bookkeeping; see
+        delete_messages. The caller commits.
+        """
+        ids = list(ids)
+        for i in range(0, len(ids), MessageService.DELETE_CHUNK):
+            chunk = ids[i:i + MessageService.DELETE_CHUNK]
+            poll_ids = select(Poll.id).where(Poll.message_id.in_(chunk))
+            option_ids = select(PollOption.id).where(PollOption.poll_id.in_(poll_ids))
+            PollVote.query.filter(PollVote.option_id.in_(option_ids)).delete(synchronize_session=False)
+            PollOption.query.filter(PollOption.poll_id.in_(poll_ids)).delete(synchronize_session=False)
+            Poll.query.filter(Poll.message_id.in_(chunk)).delete(synchronize_session=False)
+            MessageReaction.query.filter(MessageReaction.message_id.in_(chunk)).delete(synchronize_session=False)
+            MessageReactionCount.query.filter(MessageReactionCount.message_id.in_(chunk)).delete(synchronize_session=False)
+            Notification.query.filter(Notification.message_id.in_(chunk)).delete(synchronize_session=False)
+            broadcast_ids = select(BroadcastNotification.id).where(BroadcastNotification.message_id.in_(chunk))
+            BroadcastDismissal.query.filter(BroadcastDismissal.broadcast_id.in_(broadcast_ids)).delete(synchronize_session=False)
+            BroadcastNotification.query.filter(BroadcastNotification.message_id.in_(chunk)).delete(synchronize_session=False)
+            NotificationJob.query.filter(NotificationJob.message_id.in_(chunk)).delete(synchronize_session=False)
+            Message.query.filter(Message.reply_to_id.in_(chunk)).update({'reply_to_id': None}, synchronize_session=False)
+            search_index.unindex_messages(chunk)
+            Message.query.filter(Message.id.in_(chunk)).delete(synchronize_session=False)
+
+    @staticmethod
+    def delete_messages(ids):
+        """
+        Delete chat messages as a user-visible action: unread counters, change
+        feed and cache are updated before the rows go. The caller commits and
+        then publishes. Returns {channel_id: [message ids]} for what was deleted.
+        """
+        by_channel = {}
+        for i in range(0, len(ids), MessageService.DELETE_CHUNK):
+            chunk = ids[i:i + MessageService.DELETE_CHUNK]
+            for msg_id, channel_id in db.session.query(Message.id, Message.channel_id).filter(Message.id.in_(chunk)):
+                by_channel.setdefault(channel_id, []).append(msg_id)
+        found = [msg_id for msg_ids in by_channel.values() for msg_id in msg_ids]
+        if not found:
+            return {}
+
+        UnreadService.unbump_many(found)
+        db.session.execute(insert(ChannelChange), [
+            {'channel_id': channel_id, 'kind': 'deleted', 'message_id': msg_id}
+            for channel_id, msg_ids in by_channel.items() for msg_id in sorted(msg_ids)])
+        MessageService.purge(found)
+        gone = set(found)
+        message_cache().evict(lambda key: key[0] in gone)
+        return by_channel
+
+    @staticmethod
+    def touch(message_id):
+        """Bump a message's version after its reactions or poll change, retiring its cached payload."""
+        Message.query.filter_by(id=message_id).update({'version': Message.version + 1}, synchronize_session=False)
+
+
+class ChangeFeed:
+    # Changes returned per call; clients page with `since` while has_more is set
+    PAGE_SIZE = 500
+
+    @staticmethod
+    def record(channel_id, kind, message_id, **details):
+        """
+        Append a change to the channel's feed. Added to the current session,
+        so it commits (or rolls back) together with the write it describes.
+        """
+        change = ChannelChange(channel_id=channel_id, kind=kind, message_id=message_id,
+                               payload=json.dumps(details) if details else '')
+        db.session.add(change)
+        return change
+
+    @staticmethod
+    def latest_seq(channel_id):
+        return db.session.query(db.func.max(ChannelChange.id)).filter(ChannelChange.channel_id == channel_id).scalar() or 0
+
+    @staticmethod
+    def changes_since(channel_id, since, viewer):
+        """
+        Return the deltas after `since` for a channel:
+        - created / poll_vote entries come back as freshly serialized messages
+        - deleted entries carry only the message id
+        - reaction entries carry the emoji, the acting user and the new count
+        `reset` is set when `since` predates the retained log and the client must reload.
+        """
+        oldest = db.session.query(db.func.min(ChannelChange.id)).scalar()
+        if since and oldest and since < oldest - 1:
+            return {'seq': ChangeFeed.latest_seq(channel_id), 'reset': True, 'changes': [], 'messages': [], 'has_more': False}
+
+        changes = ChannelChange.query.filter(
+            ChannelChange.channel_id == channel_id, ChannelChange.id > since
+        ).order_by(ChannelChange.id).limit(ChangeFeed.PAGE_SIZE + 1).all()
+        has_more = len(changes) > ChangeFeed.PAGE_SIZE
+        changes = changes[:ChangeFeed.PAGE_SIZE]
+
+        refresh_ids = {c.message_id for c in changes if c.kind in ('created', 'poll_vote')}
+        deleted_ids = {c.message_id for c in changes if c.kind == 'deleted'}
+        refresh_ids -= deleted_ids
+        messages = Message.query.filter(Message.id.in_(refresh_ids)).order_by(Message.id).all() if refresh_ids else []
+
+        return {
+            'seq': changes[-1].id if changes else max(since, ChangeFeed.latest_seq(channel_id)),
+            'reset': False,
+            'has_more': has_more,
+            'changes': [dict(json.loads(c.payload) if c.payload else {}, seq=c.id, kind=c.kind, message_id=c.message_id) for c in changes],
+            'messages': MessageService.serialize_page(messages, viewer)
+        }
+
+    @staticmethod
+    def prune(older_than_days=30):
+        """Drop change entries older than the retention window. Returns the number removed."""
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        removed = ChannelChange.query.filter(ChannelChange.created_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return removed
+
+
+class ReactionService:
+    @staticmethod
+    def _bump(message_id, emoji, delta):
+        """Atomically add `delta` to a (message, emoji) counter, creating or dropping the row as needed."""
+        table = MessageReactionCount.__table__
+        key = (table.c.message_id == message_id) & (table.c.emoji == emoji)
+        if delta > 0:
+            dialect = db.session.get_bind().dialect.name
+            if dialect in ('sqlite', 'postgresql'):
+                upsert = (sqlite_insert if dialect == 'sqlite' else pg_insert)(table).values(
+                    message_id=message_id, emoji=emoji, count=delta, created_at=datetime.utcnow())
+                db.session.execute(upsert.on_conflict_do_update(
+                    index_elements=['message_id', 'emoji'], set_={'count': table.c.count + delta}))
+                return
+            if db.session.execute(table.update().where(key).values(count=table.c.count + delta)).rowcount == 0:
+                db.session.execute(table.insert().values(message_id=message_id, emoji=emoji, count=delta, created_at=datetime.utcnow()))
+        else:
+            db.session.execute(table.update().where(key).values(count=table.c.count + delta))
+            db.session.execute(table.delete().where(key & (table.c.count <= 0)))
+
+    @staticmethod
+    def toggle(msg, user_id, emoji):
+        """
+        Add or remove a user's reaction and keep the counter in step.
+        Returns (action, new_count); the caller commits.
+        """
+        existing = MessageReaction.query.filter_by(message_id=msg.id, user_id=user_id, emoji=emoji).first()
+        if existing:
+            db.session.delete(existing)
+            action, delta = 'removed', -1
+        else:
+            db.session.add(MessageReaction(message_id=msg.id, user_id=user_id, emoji=emoji))
+            action, delta = 'added', 1
+        db.session.flush()
+        ReactionService._bump(msg.id, emoji, delta)
+        MessageService.touch(msg.id)
+
+        count = db.session.query(MessageReactionCount.count).filter_by(message_id=msg.id, emoji=emoji).scalar() or 0
+        ChangeFeed.record(msg.channel_id, 'reaction', msg.id, emoji=emoji, user_id=user_id, action=action, count=count)
+        return action, count
+
+    @staticmethod
+    def reconcile():
+        """Rebuild every counter from message_reactions in one set-based pass. Returns rows written."""
+        MessageReactionCount.query.delete(synchronize_session=False)
+        source = select(
+            MessageReaction.message_id, MessageReaction.emoji,
+            func.count(MessageReaction.id), func.min(MessageReaction.created_at)
+        ).group_by(MessageReaction.message_id, MessageReaction.emoji)
+        db.session.execute(insert(MessageReactionCount.__table__).from_select(
+            ['message_id', 'emoji', 'count', 'created_at'], source))
+        db.session.commit()
+        return MessageReactionCount.query.count()
+
+
+class UnreadService:
+    @staticmethod
+    def bump(msg):
+        """A new message is unread for every other member; the sender has read up to it."""
+        after_commit(ChannelListService.invalidate_channel, msg.channel_id)
+        ChannelMember.query.filter(
+            ChannelMember.channel_id == msg.channel_id, ChannelMember.user_id != msg.user_id
+        ).update({'unread_count': ChannelMember.unread_count + 1}, synchronize_session=False)
+        ChannelMember.query.filter_by(channel_id=msg.channel_id, user_id=msg.user_id).update(
+            {'last_read_message_id': msg.id, 'unread_count': 0}, synchronize_session=False)
+
+    @staticmethod
+    def unbump_many(message_ids):
+        """Take messages about to be deleted back out of the counts of members who hadn't read them yet."""
+        unread = select(func.count(Message.id)).where(
+            Message.id.in_(message_ids), Message.channel_id == ChannelMember.channel_id,
+            Message.user_id != ChannelMember.user_id, Message.id > ChannelMember.last_read_message_id
+        ).scalar_subquery()
+        channel_ids = select(Message.channel_id).where(Message.id.in_(message_ids)).distinct()
+        for (channel_id,) in db.session.execute(channel_ids):
+            after_commit(ChannelListService.invalidate_channel, channel_id)
+        ChannelMember.query.filter(ChannelMember.channel_id.in_(channel_ids), ChannelMember.unread_count > 0).update(
+            {'unread_count': case((unread >= ChannelMember.unread_count, 0), else_=ChannelMember.unread_count - unread)},
+            synchronize_session=False)
+
+    @staticmethod
+    def mark_read(membership, message_id=None):
+        """
+        Advance a member's cursor (never backwards) to `message_id`, or to the
+        newest message, and recount what is left after it. Returns the unread count.
+        """
+        if message_id is None:
+            message_id = db.session.query(func.max(Message.id)).filter(Message.channel_id == membership.channel_id).scalar() or 0
+        if message_id <= membership.last_read_message_id:
+            return membership.unread_count
+        after_commit(ChannelListService.invalidate, [membership.user_id])
+        membership.last_read_message_id = message_id
+        membership.unread_count = db.session.query(func.count(Message.id)).filter(
+            Message.channel_id == membership.channel_id, Message.id > message_id, Message.user_id != membership.user_id
+        ).scalar()
+        return membership.unread_count
+
+
+class NotificationService:
+    """
+    Unread notifications come from two places: targeted rows (one per
+    recipient, e.g. @mentions) and broadcasts, stored once and hidden per
+    user by a dismissal marker. Both are read back in a single query.
+    """
+
+    @staticmethod
+    def broadcast(message_id, sender_id):
+        """Notify everyone but the sender about a message with one row. The caller commits."""
+        notice = BroadcastNotification(message_id=message_id, sender_id=sender_id)
+        db.session.add(notice)
+        return notice
+
+    @staticmethod
+    def _unread_broadcasts(user, *columns):
+        dismissed = select(BroadcastDismissal.id).where(
+            BroadcastDismissal.broadcast_id == BroadcastNotification.id, BroadcastDismissal.user_id == user.id)
+        query = select(*columns).where(BroadcastNotification.sender_id != user.id, ~dismissed.exists())
+        if user.joined_at:
+            # Announcements from before someone joined aren't theirs to read
+            query = query.where(BroadcastNotification.created_at >= user.joined_at)
+        return query
+
+    @staticmethod
+    def _unread_targeted(user, *columns):
+        return select(*columns).where(Notification.user_id == user.id, Notification.is_read == False)
+
+    @staticmethod
+    def unread(user):
+        """
+        Unread notifications, newest first, as rows of (kind, id, message_id,
+        created_at, channel_id, content, author_name); kind is 'targeted' or 'broadcast'.
+        """
+        feed = union_all(
+            NotificationService._unread_targeted(user, literal('targeted').label('kind'), Notification.id, Notification.message_id, Notification.created_at),
+            NotificationService._unread_broadcasts(user, literal('broadcast'), BroadcastNotification.id, BroadcastNotification.message_id, BroadcastNotification.created_at),
+        ).subquery()
+        return db.session.execute(
+            select(feed.c.kind, feed.c.id, feed.c.message_id, feed.c.created_at, Message.channel_id, Message.content, User.name)
+            .join(Message, Message.id == feed.c.message_id).join(User, User.id == Message.user_id)
+            .order_by(feed.c.created_at.desc(), feed.c.id.desc())
+        ).all()
+
+    @staticmethod
+    def watermark(user):
+        """Cheap fingerprint of the unread set: changes whenever one is added or read."""
+        counts = db.session.execute(select(
+            NotificationService._unread_targeted(user, func.count(Notification.id)).scalar_subquery(),
+            NotificationService._unread_targeted(user, func.max(Notification.id)).scalar_subquery(),
+            NotificationService._unread_broadcasts(user, func.count(BroadcastNotification.id)).scalar_subquery(),
+            NotificationService._unread_broadcasts(user, func.max(BroadcastNotification.id)).scalar_subquery(),
+        )).one()
+        return '-'.join(str(n or 0) for n in counts)
+
+    @staticmethod
+    def dismiss(user_id, broadcast_id):
+        """Mark a broadcast read for one user. The caller commits."""
+        if not BroadcastDismissal.query.filter_by(broadcast_id=broadcast_id, user_id=user_id).first():
+            db.session.add(BroadcastDismissal(broadcast_id=broadcast_id, user_id=user_id))
+
+
+class MembershipService:
+    @staticmethod
+    def add(channel_id, *criteria, added_by=None):
+        """
+        Add every user matching `criteria` (User filters; none = everyone)
+        who isn't in the channel yet, in one INSERT ... SELECT ... WHERE NOT
+        EXISTS. Returns the ids added; the caller commits, which drops their
+        cached memberships and channel lists.
+        """
+        already_in = select(ChannelMember.id).where(ChannelMember.channel_id == channel_id, ChannelMember.user_id == User.id)
+        candidates = select(User.id).where(*criteria, ~already_in.exists())
+        rows = candidates.with_only_columns(literal(channel_id), User.id, literal(added_by, Integer), literal(datetime.utcnow(), DateTime))
+        stmt = insert(ChannelMember).from_select(['channel_id', 'user_id', 'added_by', 'added_at'], rows)
+
+        if db.session.get_bind().dialect.insert_returning:
+            added = list(db.session.scalars(stmt.returning(ChannelMember.user_id)))
+        else:
+            added = list(db.session.scalars(candidates))
+            db.session.execute(stmt)
+        after_commit(MembershipService.invalidate, added)
+        after_commit(ChannelListService.invalidate, added)
+        return added
+
+    @staticmethod
+    def memberships(user_id):
+        """
+        {channel_id: {'owner': bool, 'dm': bool}} for every channel the user
+        belongs to, from the per-worker cache; one query on a miss. Treat it
+        as read-only.
+        """
+        entry = membership_cache().get(user_id)
+        if entry is None:
+            entry = {channel_id: {'owner': created_by == user_id, 'dm': channel_type == 'dm'}
+                     for channel_id, created_by, channel_type in db.session.query(
+                         ChannelMember.channel_id, Channel.created_by, Channel.channel_type
+                     ).join(Channel, Channel.id == ChannelMember.channel_id).filter(ChannelMember.user_id == user_id)}
+            membership_cache().put(user_id, entry)
+        return entry
+
+    @staticmethod
+    def is_member(user_id, channel_id):
+        """
+        Authorization for channel-scoped calls. A cached "yes" is trusted
+        until invalidated or expired; a "no" is re-read once, so a join made
+        through another worker is honoured straight away.
+        """
+        if channel_id in MembershipService.memberships(user_id):
+            return True
+        MembershipService.invalidate([user_id])
+        return channel_id in MembershipService.memberships(user_id)
+
+    @staticmethod
+    def invalidate(user_ids):
+        """These users joined or left channels."""
+        user_ids = set(user_ids)
+        membership_cache().evict(lambda key: key in user_ids)
+
+
+class ChannelListService:
+    """
+    The sidebar channel list of a user: open groups plus every channel they
+    belong to, with unread counts, member settings and the other side of
+    each DM. Built with one query and cached per user until something in it
+    changes; callers that change memberships, settings or profiles invalidate.
+    """
+
+    @staticmethod
+    def build(user):
+        me = aliased(ChannelMember)
+        peer = aliased(ChannelMember)
+        rows = db.session.query(
+            Channel.id, Channel.name, Channel.channel_type, Channel.is_private,
+            me.id, me.unread_count, me.is_muted, me.is_pinned, me.is_archived,
+            User.id, User.name, User.avatar_color, User.is_online,
+        ).outerjoin(me, and_(me.channel_id == Channel.id, me.user_id == user.id)
+        ).outerjoin(peer, and_(Channel.channel_type == 'dm', peer.channel_id == Channel.id, peer.user_id != user.id)
+        ).outerjoin(User, User.id == peer.user_id
+        ).filter(or_(and_(Channel.is_private == False, Channel.channel_type == 'group'), me.id.isnot(None))
+        ).order_by(Channel.created_at, Channel.id).all()
+
+        channels, seen = [], set()
+        for (cid, name, channel_type, is_private, membership_id, unread, muted, pinned, archived,
+             peer_id, peer_name, peer_color, peer_online) in rows:
+            if cid in seen:
+                continue  # a DM with more than one other member: show the first
+            seen.add(cid)
+            channels.append({
+                'id': cid,
+                'name': name,
+                'channel_type': channel_type,
+                'is_private': is_private,
+                'is_member': membership_id is not None,
+                'unread_count': unread or 0,
+                'is_muted': bool(muted),
+                'is_pinned': bool(pinned),
+                'is_archived': bool(archived),
+                'other_user_id': peer_id,
+                'other_user_name': peer_name,
+                'other_user_avatar_color': peer_color,
+                'other_user_online': bool(peer_online),
+            })
+        return channels
+
+    @staticmethod
+    def get(user):
+        """The cached list, rebuilt on a miss. Treat it as read-only."""
+        entry = channel_list_cache().get(user.id)
+        if entry is None:
+            channels = ChannelListService.build(user)
+            entry = {
+                'channels': channels,
+                'member_of': frozenset(c['id'] for c in channels if c['is_member']),
+                'peers': frozenset(c['other_user_id'] for c in channels if c['other_user_id']),
+            }
+            channel_list_cache().put(user.id, entry)
+        return entry['channels']
+
+    @staticmethod
+    def invalidate(user_ids):
+        """Memberships or settings of these users changed."""
+        user_ids = set(user_ids)
+        channel_list_cache().evict(lambda key: key in user_ids)
+
+    @staticmethod
+    def invalidate_channel(channel_id):
+        """Something every member of a channel sees changed (a new message, a rename)."""
+        channel_list_cache().evict_items(lambda key, entry: channel_id in entry['member_of'])
+
+    @staticmethod
+    def invalidate_peers(user_ids):
+        """These users' name, color or presence changed: refresh the lists showing them as a DM."""
+        user_ids = set(user_ids)
+        channel_list_cache().evict_items(lambda key, entry: user_ids & entry['peers'] or key in user_ids)
+
+    @staticmethod
+    def invalidate_all():
+        """A channel appeared or vanished (new open group, deleted member)."""
+        channel_list_cache().clear()
+
+
+class DirectMessageService:
+    @staticmethod
+    def pair(user_id, other_id):
+        """Canonical (user_low, user_high) key of a DM."""
+        return (user_id, other_id) if user_id < other_id else (other_id, user_id)
+
+    @staticmethod
+    def find(user_id, other_id):
+        """Channel id of the DM between two users, or None. One unique-index lookup."""
+        low, high = DirectMessageService.pair(user_id, other_id)
+        return db.session.query(DirectMessagePair.channel_id).filter_by(user_low=low, user_high=high).scalar()
+
+    @staticmethod
+    def open(user, target):
+        """
+        The DM channel between two users, created on first use; returns
+        (channel_id, created). The pair row is inserted in the same
+        transaction as the channel, so when two requests race the unique
+        constraint rejects the loser, whose channel is rolled back.
+        """
+        user_id, target_id = user.id, target.id  # still usable after a rollback
+        channel_id = DirectMessageService.find(user_id, target_id)
+        if channel_id:
+            return channel_id, False
+
+        channel = Channel(name=f'DM-{user_id}-{target_id}', channel_type='dm', created_by=user_id, is_private=True)
+        db.session.add(channel)
+        db.session.flush()
+        low, high = DirectMessageService.pair(user_id, target_id)
+        try:
+            db.session.execute(insert(DirectMessagePair).values(
+                user_low=low, user_high=high, channel_id=channel.id, created_at=datetime.utcnow()))
+        except IntegrityError:
+            db.session.rollback()
+            return DirectMessageService.find(user_id, target_id), False
+        db.session.add(ChannelMember(channel_id=channel.id, user_id=user_id, added_by=user_id))
+        db.session.add(ChannelMember(channel_id=channel.id, user_id=target_id, added_by=user_id))
+        db.session.commit()
+        MembershipService.invalidate([user_id, target_id])
+        return channel.id, True
+
+    @staticmethod
+    def forget_user(user_id):
+        """Drop a deleted user's pairs, so a later account can't inherit their DMs. The caller commits."""
+        DirectMessagePair.query.filter(or_(DirectMessagePair.user_low == user_id, DirectMessagePair.user_high == user_id)).delete(synchronize_session=False)
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+
+# app.py builds the app on import: give it a scratch database and run the background pools inline
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+for name in ('NOTIFY_WORKERS', 'MODERATION_WORKERS', 'PASSWORD_WORKERS'):
+    os.environ[name] = '0'
+
+from app import app as flask_app
+from models import db, User
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        yield flask_app
+        db.session.rollback()
+        db.session.remove()
+
+
+@pytest.fixture
+def admin(app):
+    return User.query.filter_by(email='admin@iic.club').first()
+
+
+@pytest.fixture
+def client_for(app):
+    """A test client signed in as the given user."""
+    def make(user):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user.id
+        return client
+    return make
+
+
+@pytest.fixture
+def count_queries(app):
+    """Context manager yielding a list that collects the SQL this thread runs inside it."""
+    @contextmanager
+    def counting():
+        statements, thread = [], threading.get_ident()
+
+        def record(conn, cursor, statement, *args):
+            if threading.get_ident() == thread:  # not the presence flusher or other pools
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    return counting
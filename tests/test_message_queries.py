@@ -0,0 +1,61 @@
+import pytest
+from cache import message_cache, user_cache, membership_cache
+from models import db, User, Channel, ChannelMember, Message, MessageReaction, MessageReactionCount, Poll, PollOption, PollVote, Task
+
+
+@pytest.fixture
+def authors(app, admin):
+    users = User.query.filter(User.email.like('author-%@test.invalid')).order_by(User.id).all()
+    if not users:
+        users = [User(unique_id=f'T-{i}', name=f'Author {i}', email=f'author-{i}@test.invalid', password_hash='!', role='member')
+                 for i in range(4)]
+        db.session.add_all(users)
+        db.session.commit()
+    return [admin] + users
+
+
+def make_channel(authors, n):
+    """A channel with `n` messages carrying every kind of related row the page serializer loads."""
+    channel = Channel(name=f'queries-{n}', created_by=authors[0].id)
+    db.session.add(channel)
+    db.session.flush()
+    db.session.add_all([ChannelMember(channel_id=channel.id, user_id=u.id) for u in authors])
+    task = Task(title='Referenced', created_by=authors[0].id)
+    db.session.add(task)
+    db.session.flush()
+
+    messages = [Message(channel_id=channel.id, user_id=authors[i % len(authors)].id, content=f'message {i}',
+                        referenced_task_id=task.id if i % 7 == 0 else None) for i in range(n)]
+    db.session.add_all(messages)
+    db.session.flush()
+    for i, msg in enumerate(messages):
+        reactors = authors[:1 + i % 3]
+        db.session.add_all([MessageReaction(message_id=msg.id, user_id=u.id, emoji='👍') for u in reactors])
+        db.session.add(MessageReactionCount(message_id=msg.id, emoji='👍', count=len(reactors)))
+        if i % 20 == 0:
+            poll = Poll(channel_id=channel.id, message_id=msg.id, question='Which?', created_by=msg.user_id)
+            db.session.add(poll)
+            db.session.flush()
+            options = [PollOption(poll_id=poll.id, text=t, sort_order=k) for k, t in enumerate('abc')]
+            db.session.add_all(options)
+            db.session.flush()
+            db.session.add_all([PollVote(option_id=options[k % 3].id, user_id=u.id) for k, u in enumerate(authors)])
+    db.session.commit()
+    return channel.id
+
+
+def page_statements(client_for, count_queries, user, channel_id, n):
+    for cache in (message_cache(), user_cache(), membership_cache()):
+        cache.clear()
+    client = client_for(user)
+    with count_queries() as statements:
+        response = client.get(f'/api/messages/{channel_id}?limit={n}')
+    assert response.status_code == 200
+    assert len(response.get_json()) == n
+    return statements
+
+
+def test_message_page_query_count_is_independent_of_page_size(app, authors, client_for, count_queries):
+    small = page_statements(client_for, count_queries, authors[0], make_channel(authors, 10), 10)
+    large = page_statements(client_for, count_queries, authors[0], make_channel(authors, 1000), 1000)
+    assert len(large) == len(small), '\n'.join(large)
@@ -0,0 +1,15 @@
+import pytest
+from query_plans import KEY_QUERIES, check_query_plans
+
+
+@pytest.fixture(scope='module')
+def plans():
+    from app import app
+    with app.app_context():
+        return {r['name']: r for r in check_query_plans()}
+
+
+@pytest.mark.parametrize('name', [name for name, _ in KEY_QUERIES])
+def test_key_query_is_served_by_an_index(plans, name):
+    report = plans[name]
+    assert not report['full_scans'], f"{report['sql']}\n" + '\n'.join(report['plan'])
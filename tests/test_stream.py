@@ -0,0 +1,17 @@
+import threading
+
+
+def test_streams_beyond_the_worker_cap_get_503_until_one_closes(app, admin, client_for, monkeypatch):
+    monkeypatch.setitem(app.extensions, 'stream_slots', threading.BoundedSemaphore(1))
+    client = client_for(admin)
+
+    first = client.get('/api/stream', buffered=False)
+    assert first.status_code == 200
+    refused = client.get('/api/stream', buffered=False)
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After']
+
+    first.close()  # the client went away before the first event
+    again = client.get('/api/stream', buffered=False)
+    assert again.status_code == 200
+    again.close()
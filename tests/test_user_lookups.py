@@ -0,0 +1,38 @@
+import pytest
+from app import app as flask_app
+from models import User, ChannelMember
+
+PAGES = ['/dashboard', '/analytics', '/members', '/discussion', '/resources', '/tasks', '/calendar', '/sheets']
+API = ['/api/channels', '/api/sync?channels=&notifications=', '/api/members', '/api/mentions/suggest?q=a',
+       '/api/resources', '/api/notifications', '/api/tasks', '/api/search?q=hello', '/api/moderation/jobs']
+
+
+@pytest.fixture
+def checked_client(monkeypatch):
+    """
+    An admin client with USER_LOOKUP_CHECK on. Deliberately outside the `app`
+    fixture's context: each request must get its own flask.g, or the user
+    memoized by an earlier request would hide a repeat lookup.
+    """
+    monkeypatch.setitem(flask_app.config, 'USER_LOOKUP_CHECK', True)
+    monkeypatch.setitem(flask_app.config, 'PROPAGATE_EXCEPTIONS', True)  # surface the check's AssertionError
+    with flask_app.app_context():
+        admin = User.query.filter_by(email='admin@iic.club').first()
+        member = ChannelMember.query.filter_by(user_id=admin.id).first()
+        admin_id, channel_id = admin.id, member.channel_id if member else None
+    client = flask_app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = admin_id
+    return client, channel_id
+
+
+def test_each_request_loads_the_signed_in_user_at_most_once(checked_client):
+    client, channel_id = checked_client
+    urls = PAGES + API
+    if channel_id:
+        urls += [f'/chat/{channel_id}', f'/api/messages/{channel_id}', f'/api/channels/{channel_id}/changes?since=0']
+    for url in urls:
+        for cache in ('user_cache', 'membership_cache'):
+            flask_app.extensions[cache].clear()  # make every request take the cold path
+        response = client.get(url)
+        assert response.status_code < 500, url
@@ -1,10 +1,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, abort, jsonify
 from datetime import datetime, date
-from models import db, User, Message, Resource, Event, Task, Channel, ChannelMember, TaskAssignee, Sheet, Notification, Achievement, Attendance
-from helpers import login_required, role_required, get_current_user, generate_unique_id, get_random_color
-from werkzeug.security import generate_password_hash
+from models import db, User, Message, Resource, Event, Task, Channel, ChannelMember, TaskAssignee, Sheet, Achievement, Attendance
+from helpers import login_required, role_required, get_current_user, generate_unique_id, get_random_color, mom_preview, user_record_changed
 import calendar as cal
-from services import AnalyticsService
+from services import AnalyticsService, MessageService, ChannelListService, ChangeFeed, DirectMessageService, MembershipService, NotificationService
+import realtime
+from mentions import get_index as mention_index
+from passwords import HasherBusy, get_hasher as hasher
+from api import channel_list, message_page
 
 views = Blueprint('views', __name__)
 
@@ -54,7 +57,10 @@ def update_profile():
     user.current_work = request.form.get('current_work', user.current_work)
     user.bio = request.form.get('bio', user.bio)
     user.name = request.form.get('name', user.name)
+    user_record_changed(user)
     db.session.commit()
+    mention_index().upsert(user)
+    ChannelListService.invalidate_peers([user.id])
     flash('Profile updated successfully!', 'success')
     return redirect(url_for('views.dashboard'))
 
@@ -114,12 +120,18 @@ def add_member():
     if role not in ('jsec', 'coordinator', 'member'):
         role = 'member'
 
+    try:
+        password_hash = hasher().hash(password)
+    except HasherBusy:
+        flash('Server busy, please try again in a moment.', 'error')
+        return redirect(url_for('views.members'))
+
     unique_id = generate_unique_id()
     new_user = User(
         unique_id=unique_id,
         name=name,
         email=email,
-        password_hash=generate_password_hash(password),
+        password_hash=password_hash,
         role=role,
         avatar_color=get_random_color()
     )
@@ -133,6 +145,7 @@ def add_member():
         db.session.add(membership)
 
     db.session.commit()
+    mention_index().upsert(new_user)
     flash(f'Member {name} ({unique_id}) added!', 'success')
     return redirect(url_for('views.members'))
 
@@ -177,7 +190,10 @@ def edit_member(member_id):
     member.expertise = request.form.get('expertise', member.expertise)
     member.current_work = request.form.get('current_work', member.current_work)
     member.bio = request.form.get('bio', member.bio)
+    user_record_changed(member)
     db.session.commit()
+    mention_index().upsert(member)
+    ChannelListService.invalidate_peers([member.id])
     flash(f'{member.name} updated.', 'success')
     return redirect(url_for('views.member_profile', member_id=member.id))
 
@@ -190,8 +206,13 @@ def delete_member(member_id):
     if member.id == user.id:
         flash('You cannot delete yourself.', 'error')
         return redirect(url_for('views.members'))
+    user_record_changed(member)
     db.session.delete(member)
+    DirectMessageService.forget_user(member_id)
     db.session.commit()
+    mention_index().remove(member_id)
+    MembershipService.invalidate([member_id])
+    ChannelListService.invalidate_all()
     flash(f'{member.name} has been removed.', 'success')
     return redirect(url_for('views.members'))
 
@@ -200,17 +221,6 @@ def delete_member(member_id):
 # DISCUSSION / CHANNELS
 # ═══════════════════════════════════════════════════
 
-def user_channels(user):
-    """Get all channels a user has access to (member of, or DM participant)."""
-    member_channel_ids = [cm.channel_id for cm in ChannelMember.query.filter_by(user_id=user.id).all()]
-    return Channel.query.filter(Channel.id.in_(member_channel_ids)).order_by(Channel.created_at.asc()).all()
-
-def get_dm_channels(user):
-    """Get DM channels for a user."""
-    member_channel_ids = [cm.channel_id for cm in ChannelMember.query.filter_by(user_id=user.id).all()]
-    return Channel.query.filter(Channel.id.in_(member_channel_ids), Channel.channel_type == 'dm').all()
-
-
 @views.route('/discussion', methods=['GET', 'POST'])
 @views.route('/chat/<int:channel_id>', methods=['GET', 'POST'])
 @login_required
@@ -224,8 +234,7 @@ def discussion(channel_id=None):
         referenced_task_id = request.form.get('referenced_task_id', type=int)
 
         if content and channel_id:
-            is_member = ChannelMember.query.filter_by(channel_id=channel_id, user_id=user.id).first()
-            if is_member:
+            if MembershipService.is_member(user.id, channel_id):
                 msg = Message(
                     user_id=user.id,
                     content=content,
@@ -234,55 +243,53 @@ def discussion(channel_id=None):
                     referenced_task_id=referenced_task_id
                 )
                 db.session.add(msg)
+                db.session.flush()
+                MessageService.record_created(msg)
                 db.session.commit()
+                realtime.publish_message(msg)
             else:
                 flash('You are not a member of this channel.', 'error')
 
         return redirect(url_for('views.discussion', channel_id=channel_id))
 
-    group_channels = [c for c in user_channels(user) if c.channel_type == 'group']
-    dm_channels = get_dm_channels(user)
+    # Sidebar: the cached channel list, DM peers included (one query when cold)
+    sidebar = [c for c in channel_list(user) if c['is_member']]
+    group_channels = [c for c in sidebar if c['channel_type'] == 'group']
+    dm_channels = [c for c in sidebar if c['channel_type'] == 'dm' and c['other_user_id']]
 
     if channel_id is None:
         channel_id = request.args.get('channel_id', type=int)
 
     current_channel = None
+    current_channel_member = None
     if channel_id:
-        current_channel = Channel.query.get(channel_id)
+        current_channel = db.session.get(Channel, channel_id)
         if current_channel:
-            is_member = ChannelMember.query.filter_by(channel_id=current_channel.id, user_id=user.id).first()
-            if not is_member:
+            if MembershipService.is_member(user.id, current_channel.id):
+                # Mute / pin / archive flags for the settings panel ride along in the channel list
+                current_channel_member = (next((c for c in sidebar if c['id'] == current_channel.id), None)
+                                          or ChannelMember.query.filter_by(channel_id=current_channel.id, user_id=user.id).first())
+            if not current_channel_member:
                 flash('Access denied.', 'error')
                 current_channel = None
 
     # Don't auto-select a channel — let the channel list page render
     # (especially important for WhatsApp-style mobile layout)
 
-    messages = []
-    channel_members_list = []
-    current_channel_member = None
+    # Only the newest page ships with the shell; older history, the member
+    # list and the people picker are fetched when the user asks for them.
+    initial_page = None
     if current_channel:
-        messages = Message.query.filter_by(channel_id=current_channel.id).order_by(Message.created_at.asc()).all()
-        channel_members_list = ChannelMember.query.filter_by(channel_id=current_channel.id).all()
-        current_channel_member = ChannelMember.query.filter_by(channel_id=current_channel.id, user_id=user.id).first()
-
-    dm_display = []
-    for dm_ch in dm_channels:
-        other_member = ChannelMember.query.filter(ChannelMember.channel_id == dm_ch.id, ChannelMember.user_id != user.id).first()
-        if other_member:
-            other_user = User.query.get(other_member.user_id)
-            dm_display.append({'channel': dm_ch, 'other_user': other_user})
-
-    all_members = User.query.order_by(User.name).all()
+        # Position first: anything posted while the page renders is replayed by the change feed
+        seq = ChangeFeed.latest_seq(current_channel.id)
+        initial_page = {'seq': seq, 'messages': message_page(current_channel.id, user)}
 
     return render_template('discussion.html',
                            channels=group_channels,
-                           dm_channels=dm_display,
+                           dm_channels=dm_channels,
                            current_channel=current_channel,
-                           messages=messages,
-                           channel_members=channel_members_list,
                            current_channel_member=current_channel_member,
-                           all_members=all_members)
+                           initial_page=initial_page)
 
 
 @views.route('/discussion/create_channel', methods=['POST'])
@@ -315,6 +322,8 @@ def create_channel():
         membership = ChannelMember(channel_id=new_channel.id, user_id=user.id, added_by=user.id)
         db.session.add(membership)
         db.session.commit()
+        MembershipService.invalidate([user.id])
+        ChannelListService.invalidate_all()
 
         flash(f'Channel "#{name}" created!', 'success')
         return redirect(url_for('views.discussion', channel_id=new_channel.id))
@@ -331,7 +340,7 @@ def add_channel_member(channel_id):
     # Allow any member to add others? Or restrict? 
     # For now, let's allow any member to add to public groups to encourage growth, 
     # but maybe restrict for private groups (not fully implemented yet).
-    if not ChannelMember.query.filter_by(channel_id=channel.id, user_id=user.id).first():
+    if not MembershipService.is_member(user.id, channel.id):
         flash('Permission denied', 'error')
         return redirect(url_for('views.discussion', channel_id=channel.id))
 
@@ -340,19 +349,11 @@ def add_channel_member(channel_id):
     
     if role:
         # Add all users with this role
-        targets = []
-        if role == 'all':
-            targets = User.query.all()
-        else:
-            targets = User.query.filter_by(role=role).all()
-            
-        count = 0
-        for t in targets:
-             if not ChannelMember.query.filter_by(channel_id=channel.id, user_id=t.id).first():
-                 db.session.add(ChannelMember(channel_id=channel.id, user_id=t.id, added_by=user.id))
-                 count += 1
+        criteria = [] if role == 'all' else [User.role == role]
+        added_ids = MembershipService.add(channel.id, *criteria, added_by=user.id)
         db.session.commit()
-        flash(f'Added {count} members (Role: {role}).', 'success')
+        realtime.publish_channels_changed(added_ids)
+        flash(f'Added {len(added_ids)} members (Role: {role}).', 'success')
         
     elif username:
         target_user = User.query.filter_by(name=username).first()
@@ -361,6 +362,9 @@ def add_channel_member(channel_id):
                 new_member = ChannelMember(channel_id=channel.id, user_id=target_user.id, added_by=user.id)
                 db.session.add(new_member)
                 db.session.commit()
+                MembershipService.invalidate([target_user.id])
+                ChannelListService.invalidate([target_user.id])
+                realtime.publish_channels_changed([target_user.id])
                 flash(f'{target_user.name} added to channel', 'success')
             else:
                 flash(f'{target_user.name} is already a member', 'info')
@@ -396,6 +400,9 @@ def remove_channel_member(channel_id):
                 else:
                     db.session.delete(member)
                     db.session.commit()
+                    MembershipService.invalidate([target_user_id])
+                    ChannelListService.invalidate([target_user_id])
+                    realtime.publish_channels_changed([target_user_id])
                     flash('Member removed', 'success')
             else:
                 flash('Member not found', 'error')
@@ -411,6 +418,8 @@ def leave_channel(channel_id):
     if membership:
         db.session.delete(membership)
         db.session.commit()
+        MembershipService.invalidate([user.id])
+        ChannelListService.invalidate([user.id])
         flash('You left the group.', 'success')
     return redirect(url_for('views.discussion'))
     
@@ -429,6 +438,8 @@ def join_channel(channel_id):
         membership = ChannelMember(channel_id=channel_id, user_id=user.id, added_by=user.id)
         db.session.add(membership)
         db.session.commit()
+        MembershipService.invalidate([user.id])
+        ChannelListService.invalidate([user.id])
         flash(f'Joined #{channel.name}!', 'success')
     
     return redirect(url_for('views.discussion', channel_id=channel_id))
@@ -444,41 +455,24 @@ def open_dm(target_user_id):
         flash('Cannot DM yourself.', 'error')
         return redirect(url_for('views.discussion'))
 
-    user_dm_ids = [cm.channel_id for cm in ChannelMember.query.filter_by(user_id=user.id).all()]
-    target_dm_ids = [cm.channel_id for cm in ChannelMember.query.filter_by(user_id=target.id).all()]
-    common_ids = set(user_dm_ids) & set(target_dm_ids)
-
-    dm_channel = None
-    for cid in common_ids:
-        ch = Channel.query.get(cid)
-        if ch and ch.channel_type == 'dm':
-            dm_channel = ch
-            break
-
-    if not dm_channel:
-        dm_channel = Channel(
-            name=f'DM-{user.id}-{target.id}',
-            channel_type='dm',
-            created_by=user.id,
-            is_private=True
-        )
-        db.session.add(dm_channel)
-        db.session.flush()
-        db.session.add(ChannelMember(channel_id=dm_channel.id, user_id=user.id, added_by=user.id))
-        db.session.add(ChannelMember(channel_id=dm_channel.id, user_id=target.id, added_by=user.id))
-        db.session.commit()
+    channel_id, created = DirectMessageService.open(user, target)
+    if created:
+        ChannelListService.invalidate([user.id, target.id])
+        realtime.publish_channels_changed([target.id])
 
-    return redirect(url_for('views.discussion', channel_id=dm_channel.id))
+    return redirect(url_for('views.discussion', channel_id=channel_id))
 
 
 @views.route('/discussion/<int:msg_id>/delete', methods=['POST'])
 @role_required('jsec')
 def delete_message(msg_id):
     msg = Message.query.get_or_404(msg_id)
-    db.session.delete(msg)
+    channel_id = msg.channel_id
+    MessageService.delete_messages([msg.id])
     db.session.commit()
+    realtime.publish_deletion(channel_id, msg_id)
     flash('Message deleted.', 'success')
-    return redirect(url_for('views.discussion', channel_id=msg.channel_id))
+    return redirect(url_for('views.discussion', channel_id=channel_id))
 
 
 # ═══════════════════════════════════════════════════
@@ -516,16 +510,13 @@ def resources():
                 db.session.add(res_channel)
                 db.session.flush()
                 db.session.add(ChannelMember(channel_id=res_channel.id, user_id=get_current_user().id))
+                MembershipService.invalidate([get_current_user().id])
+                ChannelListService.invalidate_all()
             
             # Ensure everyone is in #resources
-            all_users = User.query.filter(User.id != get_current_user().id).all()
-            for u in all_users:
-                if not ChannelMember.query.filter_by(channel_id=res_channel.id, user_id=u.id).first():
-                    db.session.add(ChannelMember(channel_id=res_channel.id, user_id=u.id))
+            MembershipService.add(res_channel.id, User.id != get_current_user().id)
             
-            # Create Message with Metadata for Card
-            # We keep the text for notifications, but add hidden data for the UI card
-            import json
+            # Short text for notifications/previews; the UI renders the card
             card_data = {
                 "type": "resource",
                 "id": res.id,
@@ -534,22 +525,25 @@ def resources():
                 "resource_type": res.resource_type,
                 "description": res.description or ""
             }
-            msg_content = f"📊 **New Resource:** [{res.title}]({res.url})\n> {res.description or 'No description'} <!-- DATA: {json.dumps(card_data)} -->"
+            msg_content = f"📊 **New Resource:** [{res.title}]({res.url})\n> {res.description or 'No description'}"
             
             sys_msg = Message(
                 channel_id=res_channel.id,
                 user_id=get_current_user().id,
                 content=msg_content,
+                card=card_data,
                 message_type='text',
                 is_system_message=True
             )
             db.session.add(sys_msg)
-            db.session.commit()
+            db.session.flush()
+            MessageService.record_created(sys_msg)
             
-            # Notify
-            for u in all_users:
-                 db.session.add(Notification(user_id=u.id, message_id=sys_msg.id))
+            # Notify everyone else
+            NotificationService.broadcast(sys_msg.id, get_current_user().id)
             db.session.commit()
+            realtime.publish_message(sys_msg)
+            realtime.publish_broadcast_notification(sys_msg.id, exclude_user_id=get_current_user().id)
 
             flash(f'Resource "{title}" shared and posted to #resources!', 'success')
         return redirect(url_for('views.resources'))
@@ -770,9 +764,10 @@ def add_event():
         db.session.flush()
         # Add creator
         db.session.add(ChannelMember(channel_id=meetings_channel.id, user_id=get_current_user().id))
+        MembershipService.invalidate([get_current_user().id])
+        ChannelListService.invalidate_all()
     
     # 2. Create a system message with @all mention and Metadata
-    import json
     icon = '🤝' if event_type == 'meeting' else '📅'
     card_data = {
         "type": event_type, # 'event' or 'meeting'
@@ -784,29 +779,27 @@ def add_event():
         "description": event.description or ""
     }
     
-    msg_content = f"@all {icon} **New {event_type.capitalize()}:** {title} on {event_date.strftime('%b %d')} <!-- DATA: {json.dumps(card_data)} -->"
+    msg_content = f"@all {icon} **New {event_type.capitalize()}:** {title} on {event_date.strftime('%b %d')}"
     
     sys_msg = Message(
         channel_id=meetings_channel.id,
         user_id=get_current_user().id, # Sent by the creator
         content=msg_content,
+        card=card_data,
         message_type='text', 
         is_system_message=True
     )
     db.session.add(sys_msg)
     db.session.flush() # Get ID
+    MessageService.record_created(sys_msg)
     
-    # 3. Create notifications for all OTHER users
-    all_users = User.query.filter(User.id != get_current_user().id).all()
-    for u in all_users:
-        # Auto-add to meetings channel if not present
-        if not ChannelMember.query.filter_by(channel_id=meetings_channel.id, user_id=u.id).first():
-             db.session.add(ChannelMember(channel_id=meetings_channel.id, user_id=u.id))
-        
-        n = Notification(user_id=u.id, message_id=sys_msg.id)
-        db.session.add(n)
+    # 3. Auto-add everyone else to the meetings channel and notify them
+    MembershipService.add(meetings_channel.id, User.id != get_current_user().id)
+    NotificationService.broadcast(sys_msg.id, get_current_user().id)
     
     db.session.commit()
+    realtime.publish_message(sys_msg)
+    realtime.publish_broadcast_notification(sys_msg.id, exclude_user_id=get_current_user().id)
 
     flash(f'{event_type.capitalize()} "{title}" added and posted to #meetings!', 'success')
     return redirect(url_for('views.event_details', event_id=event.id))
@@ -855,28 +848,33 @@ def event_details(event_id):
                     db.session.flush()
                     # Add creator as member
                     db.session.add(ChannelMember(channel_id=meetings_channel.id, user_id=user.id))
+                    MembershipService.invalidate([user.id])
+                    ChannelListService.invalidate_all()
                 
                 # Ensure user handles membership if private (but we made it public)
-                # Post message with Metadata
-                import json
+                # Post message with a card; the full minutes stay on the event page
                 card_data = {
                     "type": "mom",
                     "id": event.id,
                     "title": event.title,
                     "date": event.event_date.strftime('%b %d'),
-                    "mom_full": new_mom  # Send full content
+                    "mom_preview": mom_preview(new_mom)
                 }
-                mom_msg_content = f"📝 **MoM Posted:** {event.title}\n\n{new_mom[:100]}... <!-- DATA: {json.dumps(card_data)} -->"
+                mom_msg_content = f"📝 **MoM Posted:** {event.title}\n\n{new_mom[:100]}..."
                 
                 mom_msg = Message(
                     channel_id=meetings_channel.id,
                     user_id=user.id,
                     content=mom_msg_content,
+                    card=card_data,
                     message_type='text',
                     is_system_message=True
                 )
                 db.session.add(mom_msg)
+                db.session.flush()
+                MessageService.record_created(mom_msg)
                 db.session.commit()
+                realtime.publish_message(mom_msg)
                 flash('MoM posted to #meetings channel.', 'info')
         
         # Handle Attendance Update
@@ -933,19 +931,17 @@ def create_sheet():
         db.session.add(res_channel)
         db.session.flush()
         db.session.add(ChannelMember(channel_id=res_channel.id, user_id=get_current_user().id))
+        MembershipService.invalidate([get_current_user().id])
+        ChannelListService.invalidate_all()
 
     # Ensure everyone is in #resources
-    all_users = User.query.filter(User.id != get_current_user().id).all()
-    for u in all_users:
-        if not ChannelMember.query.filter_by(channel_id=res_channel.id, user_id=u.id).first():
-            db.session.add(ChannelMember(channel_id=res_channel.id, user_id=u.id))
+    MembershipService.add(res_channel.id, User.id != get_current_user().id)
 
     # Create Message
     # We need a link to the sheet. url_for requires an ID, which we have after flush/commit logic? 
     # Logic above did flush, so sheet.id is available.
     sheet_link = url_for('views.sheet_view', sheet_id=sheet.id, _external=True) 
     
-    import json
     card_data = {
         "type": "resource", # Treat sheet as a resource card
         "resource_type": "sheet", # custom subtype
@@ -955,22 +951,25 @@ def create_sheet():
         "description": "Shared Spreadsheet"
     }
     
-    msg_content = f"📗 **New Sheet:** [{name}]({sheet_link}) <!-- DATA: {json.dumps(card_data)} -->"
+    msg_content = f"📗 **New Sheet:** [{name}]({sheet_link})"
     
     sys_msg = Message(
         channel_id=res_channel.id,
         user_id=get_current_user().id,
         content=msg_content,
+        card=card_data,
         message_type='text',
         is_system_message=True
     )
     db.session.add(sys_msg)
-    db.session.commit()
+    db.session.flush()
+    MessageService.record_created(sys_msg)
 
-    # Notify
-    for u in all_users:
-            db.session.add(Notification(user_id=u.id, message_id=sys_msg.id))
+    # Notify everyone else
+    NotificationService.broadcast(sys_msg.id, get_current_user().id)
     db.session.commit()
+    realtime.publish_message(sys_msg)
+    realtime.publish_broadcast_notification(sys_msg.id, exclude_user_id=get_current_user().id)
 
     flash(f'Sheet "{name}" created and posted to #resources!', 'success')
     return redirect(url_for('views.sheet_view', sheet_id=sheet.id))
@@ -0,0 +1,135 @@
+import gzip
+import time
+from flask import current_app, request, jsonify
+
+# Optional codecs: brotli for Content-Encoding: br, msgpack for compact API bodies.
+# Without them clients get gzip and JSON.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+MSGPACK_ALIASES = (MSGPACK, 'application/x-msgpack', 'application/vnd.msgpack')
+COMPRESSIBLE = (JSON, MSGPACK)
+
+
+# ─── Body encodings ───
+def available_formats():
+    return ['json', 'msgpack'] if msgpack else ['json']
+
+
+def encode(data, fmt='json'):
+    """Serialize an API payload the way respond() would, as bytes."""
+    if fmt == 'msgpack':
+        return msgpack.packb(data, use_bin_type=True, default=str)
+    return current_app.json.dumps(data).encode('utf-8')
+
+
+def wants_msgpack():
+    """True when the Accept header prefers MessagePack over JSON (browsers' */* picks JSON)."""
+    if not msgpack:
+        return False
+    return request.accept_mimetypes.best_match((JSON,) + MSGPACK_ALIASES) in MSGPACK_ALIASES
+
+
+def respond(data, status=200):
+    """jsonify(data), or the same payload as MessagePack when the client asks for it."""
+    if not wants_msgpack():
+        response = jsonify(data)
+    else:
+        response = current_app.response_class(encode(data, 'msgpack'), mimetype=MSGPACK)
+    response.status_code = status
+    response.vary.add('Accept')
+    return response
+
+
+# ─── Transfer compression ───
+def available_codings():
+    return ['br', 'gzip'] if brotli else ['gzip']
+
+
+def compress(body, coding):
+    if coding == 'br':
+        return brotli.compress(body, quality=current_app.config.get('COMPRESS_BR_QUALITY', 4))
+    return gzip.compress(body, compresslevel=current_app.config.get('COMPRESS_GZIP_LEVEL', 6))
+
+
+def negotiate_coding(accept_encodings):
+    """Best of br / gzip the client accepts (q > 0), or None."""
+    best, best_q = None, 0
+    for coding in available_codings():
+        q = accept_encodings[coding]  # wildcard-aware, 0 when refused or absent
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress_response(response):
+    """
+    after_request hook: compress JSON / MessagePack bodies above
+    COMPRESS_MIN_SIZE. Streams (SSE) and file passthroughs are left alone.
+    """
+    if (response.mimetype not in COMPRESSIBLE or response.is_streamed or response.direct_passthrough
+            or not 200 <= response.status_code < 300 or response.status_code == 204
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.content_length is not None and response.content_length < current_app.config.get('COMPRESS_MIN_SIZE', 1024):
+        return response
+    coding = negotiate_coding(request.accept_encodings)
+    if not coding:
+        return response
+
+    response.set_data(compress(response.get_data(), coding))
+    response.headers['Content-Encoding'] = coding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # Same entity, different bytes: the validator is only weakly equal now
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_wire(app):
+    """Compact JSON everywhere (pretty printing only cost bytes) and compressed API responses."""
+    app.json.compact = True
+    app.after_request(compress_response)
+
+
+# ─── Benchmark (flask bench-wire) ───
+def benchmark(paths, user_id, repeat=5):
+    """
+    Fetch each API path as `user_id` and measure every body format x
+    transfer coding on its payload. Returns rows of
+    {'path', 'format', 'coding', 'bytes', 'encode_ms'}; encode_ms covers
+    serialization plus compression, best of `repeat` runs.
+    """
+    client = current_app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    rows = []
+    for path in paths:
+        response = client.get(path, headers={'Accept': JSON, 'Accept-Encoding': 'identity'})
+        if response.status_code != 200:
+            rows.append({'path': path, 'format': '-', 'coding': f'HTTP {response.status_code}', 'bytes': 0, 'encode_ms': 0.0})
+            continue
+        data = response.get_json()
+        for fmt in available_formats():
+            for coding in ['identity'] + available_codings():
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    body = encode(data, fmt)
+                    if coding != 'identity':
+                        body = compress(body, coding)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                rows.append({'path': path, 'format': fmt, 'coding': coding, 'bytes': len(body), 'encode_ms': best * 1000})
+    return rows